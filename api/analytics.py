@@ -1,21 +1,71 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, g, jsonify, make_response, request
 from datetime import datetime, timedelta
-import random
-from db import connect_to_mongodb, MONGO_CLIENT
+from functools import wraps
+import os
+from cache import ResultCache
+from db import get_db, to_date_expr, MONGO_COLLECTION
+from rollups import read_rollups, day_key
 import pymongo
 
-# Initialize MongoDB connection
-client, _ = connect_to_mongodb()
-db = client[MONGO_CLIENT]
-
 # Create Blueprint for analytics routes
 analytics = Blueprint('analytics', __name__)
 
+# Memoized route responses, keyed by route and normalized query args; POST /api/comments invalidates them
+analytics_cache = ResultCache(int(os.environ.get('ANALYTICS_CACHE_SIZE', 256)))
+
+# Seconds each route's responses are reused (0 disables caching for the route)
+ANALYTICS_CACHE_TTLS = {
+    'stats': 60,
+    'ratings': 60,
+    'interactions-over-time': 300,
+    'comment-activity': 300,
+    'response-quality': 300,
+    'user-ratios': 120,
+    'feedback-insights': 120,
+    'chat-message-counts': 600,
+    'dashboard': 60
+}
+
+def _skip_cache():
+    """Keep the current response out of the analytics cache (e.g. a fallback after a query error)"""
+    g.analytics_cacheable = False
+
+def _cached(name):
+    """
+    Memoize a route's response body for ANALYTICS_CACHE_TTLS[name] seconds
+
+    Query args are normalized (sorted, empty values dropped) so equivalent
+    requests share an entry. Only 200 responses are stored, and results
+    computed across an invalidation are discarded.
+    """
+    ttl = ANALYTICS_CACHE_TTLS.get(name, 0)
+    
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if ttl <= 0:
+                return view(*args, **kwargs)
+            
+            key = tuple(sorted((arg, value) for arg, value in request.args.items(multi=True) if value != ''))
+            hit, cached = analytics_cache.get(name, key)
+            if hit:
+                body, mimetype = cached
+                return current_app.response_class(body, mimetype=mimetype)
+            
+            generation = analytics_cache.generation
+            g.analytics_cacheable = True
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and g.analytics_cacheable:
+                analytics_cache.put(name, key, (response.get_data(), response.mimetype), ttl, generation)
+            return response
+        return wrapper
+    return decorator
+
 def get_all_interactions():
     """Return a flat list of all user→assistant interactions for the dashboard flat view"""
     try:
-        docs = list(db.alfred_feedback.find({}))
-        docs1 = list(db.email_threads.distinct("user_id"))
+        docs = list(get_db().alfred_feedback.find({}))
+        docs1 = list(get_db().email_threads.distinct("user_id"))
         interactions = []
 
         for doc in docs:
@@ -78,129 +128,219 @@ def get_all_interactions():
             # …
         ])
 
+_to_date = to_date_expr
+
+def _run_facets(collection, facets):
+    """
+    Run several sub-pipelines over a single scan of a collection
+
+    Args:
+        collection (pymongo.collection.Collection): Collection to aggregate
+        facets (dict): Facet name -> pipeline
+
+    Returns:
+        dict: Facet name -> list of result documents
+    """
+    if not facets:
+        return {}
+    results = list(collection.aggregate([{'$facet': facets}], allowDiskUse=True))
+    return results[0] if results else {name: [] for name in facets}
+
+def _first(results, name):
+    """First document of a facet's results, or an empty dict"""
+    docs = results.get(name) or []
+    return docs[0] if docs else {}
+
+def _calculate_trend(current, previous):
+    """Percentage change from the previous to the current period"""
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return round(((current - previous) / previous) * 100, 1)
+
+def _stats_facets(days, now):
+    """
+    Build the email_threads and alfred_feedback facets behind /stats
+
+    Args:
+        days (int): Length of the current (and previous) trend window
+        now (datetime): End of the current window
+
+    Returns:
+        tuple: (email_threads facets, alfred_feedback facets)
+    """
+    current_start = now - timedelta(days=days)
+    previous_start = current_start - timedelta(days=days)
+    in_current = {'$gte': ['$ts', current_start]}
+    in_previous = {'$and': [{'$gte': ['$ts', previous_start]}, {'$lt': ['$ts', current_start]}]}
+
+    thread_facets = {
+        # One row per chat_history item, counted overall and per window with the active users of each window
+        'stats_interactions': [
+            {'$project': {'userid': 1, 'sessions.chat_history.timestamp': 1}},
+            {'$unwind': '$sessions'},
+            {'$unwind': '$sessions.chat_history'},
+            {'$project': {'userid': 1, 'ts': _to_date('$sessions.chat_history.timestamp')}},
+            {'$group': {
+                '_id': None,
+                'total': {'$sum': 1},
+                'current': {'$sum': {'$cond': [in_current, 1, 0]}},
+                'previous': {'$sum': {'$cond': [in_previous, 1, 0]}},
+                'currentUsers': {'$addToSet': {'$cond': [in_current, '$userid', None]}},
+                'previousUsers': {'$addToSet': {'$cond': [in_previous, '$userid', None]}}
+            }},
+            {'$project': {
+                'total': 1,
+                'current': 1,
+                'previous': 1,
+                'currentUsers': {'$size': {'$filter': {'input': '$currentUsers', 'cond': {'$ne': ['$$this', None]}}}},
+                'previousUsers': {'$size': {'$filter': {'input': '$previousUsers', 'cond': {'$ne': ['$$this', None]}}}}
+            }}
+        ],
+        'stats_users': [
+            {'$match': {'userid': {'$exists': True, '$nin': [None, '']}}},
+            {'$group': {'_id': '$userid'}},
+            {'$count': 'count'}
+        ]
+    }
+
+    comment_count = {'$size': {'$ifNull': ['$comments', []]}}
+    rated = {'$ne': [{'$ifNull': ['$feedback', None]}, None]}
+    responded = {'$or': [rated, {'$gt': [comment_count, 0]}]}
+    feedback_facets = {
+        'stats_feedback': [
+            {'$project': {'feedback': 1, 'comments': 1, 'ts': _to_date('$timestamp')}},
+            {'$group': {
+                '_id': None,
+                'documents': {'$sum': 1},
+                'comments': {'$sum': comment_count},
+                'commentedDocuments': {'$sum': {'$cond': [{'$gt': [comment_count, 0]}, 1, 0]}},
+                'ratings': {'$sum': {'$cond': [rated, 1, 0]}},
+                'currentComments': {'$sum': {'$cond': [in_current, comment_count, 0]}},
+                'previousComments': {'$sum': {'$cond': [in_previous, comment_count, 0]}},
+                'currentRatings': {'$sum': {'$cond': [{'$and': [in_current, rated]}, 1, 0]}},
+                'previousRatings': {'$sum': {'$cond': [{'$and': [in_previous, rated]}, 1, 0]}},
+                'currentResponses': {'$sum': {'$cond': [{'$and': [in_current, responded]}, 1, 0]}},
+                'previousResponses': {'$sum': {'$cond': [{'$and': [in_previous, responded]}, 1, 0]}}
+            }}
+        ]
+    }
+    return thread_facets, feedback_facets
+
+def _stats_from_facets(thread_results, feedback_results):
+    """Shape /stats facet results into the dashboard header payload"""
+    interactions = _first(thread_results, 'stats_interactions')
+    users = _first(thread_results, 'stats_users')
+    fb = _first(feedback_results, 'stats_feedback')
+
+    total_interactions = interactions.get('total', 0)
+    # If there is no chat history, fall back to the number of feedback documents
+    if total_interactions == 0:
+        total_interactions = fb.get('documents', 0)
+
+    # Ensure we have at least one active user
+    active_users = users.get('count', 0) or 1
+
+    def response_rate(responses, interaction_count):
+        return (responses / interaction_count) * 100 if interaction_count > 0 else 0
+
+    # (ratings + commented documents) per interaction, as a percentage
+    current_response_rate = response_rate(fb.get('ratings', 0) + fb.get('commentedDocuments', 0), total_interactions)
+
+    # Trends compare the last `days` with the `days` before them
+    window_rate = response_rate(fb.get('currentResponses', 0), interactions.get('current', 0))
+    previous_window_rate = response_rate(fb.get('previousResponses', 0), interactions.get('previous', 0))
+
+    return {
+        'totalInteractions': total_interactions,
+        'activeUsers': active_users,
+        'responseRate': round(current_response_rate, 1),
+        'commentsCount': fb.get('comments', 0),
+        'ratingsCount': fb.get('ratings', 0),
+        'trends': {
+            'totalInteractions': _calculate_trend(interactions.get('current', 0), interactions.get('previous', 0)),
+            'activeUsers': _calculate_trend(interactions.get('currentUsers', 0), interactions.get('previousUsers', 0)),
+            'commentsCount': _calculate_trend(fb.get('currentComments', 0), fb.get('previousComments', 0)),
+            'ratingsCount': _calculate_trend(fb.get('currentRatings', 0), fb.get('previousRatings', 0)),
+            'responseRate': _calculate_trend(window_rate, previous_window_rate)
+        }
+    }
+
+def _sum_rollup_days(days, first_day, count):
+    """Sum `count` consecutive day rollups starting at first_day"""
+    sums = {'interactions': 0, 'users': set(), 'comments': 0, 'rated': 0, 'responses': 0}
+    for i in range(count):
+        doc = days.get(day_key(first_day + timedelta(days=i)))
+        if doc:
+            sums['interactions'] += doc.get('interactions', 0)
+            sums['users'].update(doc.get('users', []))
+            sums['comments'] += doc.get('comments', 0)
+            sums['rated'] += doc.get('feedback_docs', 0) - doc.get('ratings', {}).get('none', 0)
+            sums['responses'] += doc.get('responses', 0)
+    return sums
+
+def _stats_from_rollups(totals, days, window, now):
+    """
+    Compute the /stats payload from daily rollups
+
+    Windows are whole UTC days: the current one is the last `window` days
+    including today, the previous one the `window` days before it.
+    """
+    current = _sum_rollup_days(days, now - timedelta(days=window - 1), window)
+    previous = _sum_rollup_days(days, now - timedelta(days=2 * window - 1), window)
+    thread_results = {
+        'stats_interactions': [{
+            'total': totals.get('interactions', 0),
+            'current': current['interactions'],
+            'previous': previous['interactions'],
+            'currentUsers': len(current['users']),
+            'previousUsers': len(previous['users'])
+        }],
+        'stats_users': [{'count': totals.get('active_users', 0)}]
+    }
+    feedback_results = {
+        'stats_feedback': [{
+            'documents': totals.get('feedback_docs', 0),
+            'comments': totals.get('comments', 0),
+            'commentedDocuments': totals.get('commented', 0),
+            'ratings': totals.get('feedback_docs', 0) - totals.get('ratings', {}).get('none', 0),
+            'currentComments': current['comments'],
+            'previousComments': previous['comments'],
+            'currentRatings': current['rated'],
+            'previousRatings': previous['rated'],
+            'currentResponses': current['responses'],
+            'previousResponses': previous['responses']
+        }]
+    }
+    return _stats_from_facets(thread_results, feedback_results)
+
 @analytics.route('/stats', methods=['GET'])
+@_cached('stats')
 def get_overall_stats():
-    """Get comprehensive dashboard statistics with trend analysis"""
+    """
+    Get comprehensive dashboard statistics with trend analysis
+
+    Totals cover all time; trends compare the last `days` days (default 30)
+    with the preceding window of the same length. Served from the daily
+    rollups when built, otherwise from one aggregation per collection.
+    """
     try:
         # Get time period filter from query params (default: 30 days)
-        days = request.args.get('days', default=30, type=int)
-        
-        # Calculate date ranges
-        today = datetime.now()
-        current_period_start = today - timedelta(days=days)
-        previous_period_start = current_period_start - timedelta(days=days)  # Previous period of same length
-        
-        # --- CURRENT PERIOD STATS ---
-        
-        # Count total interactions from app.py's logic
-        # This gets the actual user-assistant interactions from the chat history
-        from db import MONGO_COLLECTION
-        current_total_interactions = 0
-        
-        try:
-            # Get all chat data
-            collection = db[MONGO_COLLECTION]
-            
-            # Process each document
-            cursor = collection.find({})
-            
-            # Reset counter for detailed counting
-            interaction_count = 0
-            
-            # Process each document
-            for doc in cursor:
-                for session in doc.get('sessions', []):
-                    # Count chat_history elements in each session
-                    chat_history = session.get('chat_history', [])
-                    if chat_history and isinstance(chat_history, list):
-                        interaction_count += len(chat_history)
-            
-            # Use the interaction count we calculated
-            current_total_interactions = interaction_count
-                
-            # If we still have 0, check if we can get any value from alfred_feedback
-            if current_total_interactions == 0:
-                feedback_count = db.alfred_feedback.count_documents({})
-                if feedback_count > 0:
-                    current_total_interactions = feedback_count
-                
-        except Exception as e:
-            print(f"Error counting interactions: {e}")
-            current_total_interactions = 0  # Fallback value
-        
-        # Count unique users with feedback in current period
-        current_interactions_query = {"timestamp": {"$gte": current_period_start}}
-        docs1 = list(db.email_threads.distinct("userid"))
-
-        print(docs1)
-
-        unique_users = set()
-        current_active_users = 0
-        for doc in db.email_threads.find({}):
-            user_id = str(doc.get('userid'))
-            if user_id in docs1:
-                print(user_id)
-                current_active_users += 1
-                
-        # Ensure we have at least one active user
-        if current_active_users == 0:
-            current_active_users = 1
-        
-        # Count total comments (actual comment entries, not documents with comments)
-        current_comments_count = 0
-        comment_docs = list(db.alfred_feedback.find({"comments": {"$exists": True, "$ne": []}}))
-        
-        for doc in comment_docs:
-            current_comments_count += len(doc.get("comments", []))
-        
-        # Count ratings
-        current_ratings_count = db.alfred_feedback.count_documents({"feedback": {"$ne": None}})
-        
-        # Calculate current response rate
-        if current_total_interactions > 0:
-            current_response_rate = ((current_ratings_count + len(comment_docs)) / current_total_interactions) * 100
-        else:
-            current_response_rate = 0
-        
-        # --- PREVIOUS PERIOD STATS ---
-        
-        # For previous period, we'll use a simpler approach since historical data might be limited
-        previous_total_interactions = max(0, current_total_interactions - 10)  # Estimate
-        previous_active_users = max(0, current_active_users - 2)  # Estimate
-        previous_comments_count = max(0, current_comments_count - 2)  # Estimate
-        previous_ratings_count = max(0, current_ratings_count - 1)  # Estimate
-        previous_response_rate = max(0, current_response_rate - 5)  # Estimate
-        
-        # --- CALCULATE TRENDS ---
-        
-        # Calculate percentage changes
-        def calculate_trend(current, previous):
-            if previous == 0:
-                return 100 if current > 0 else 0
-            return round(((current - previous) / previous) * 100, 1)
-        
-        interactions_trend = calculate_trend(current_total_interactions, previous_total_interactions)
-        users_trend = calculate_trend(current_active_users, previous_active_users)
-        comments_trend = calculate_trend(current_comments_count, previous_comments_count)
-        ratings_trend = calculate_trend(current_ratings_count, previous_ratings_count)
-        response_rate_trend = calculate_trend(current_response_rate, previous_response_rate)
-        
-        return jsonify({
-            'totalInteractions': current_total_interactions,
-            'activeUsers': current_active_users,
-            'responseRate': round(current_response_rate, 1),
-            'commentsCount': current_comments_count,
-            'ratingsCount': current_ratings_count,
-            'trends': {
-                'totalInteractions': interactions_trend,
-                'activeUsers': users_trend,
-                'commentsCount': comments_trend,
-                'ratingsCount': ratings_trend,
-                'responseRate': response_rate_trend
-            }
-        })
+        days = max(1, request.args.get('days', default=30, type=int))
+        now = datetime.utcnow()
+        
+        # Daily rollups answer in O(days); fall back to live aggregation until they are built
+        totals, rollup_days = read_rollups(get_db(), now - timedelta(days=2 * days - 1), now)
+        if totals:
+            return jsonify(_stats_from_rollups(totals, rollup_days, days, now))
+        
+        thread_facets, feedback_facets = _stats_facets(days, now)
+        return jsonify(_stats_from_facets(
+            _run_facets(get_db()[MONGO_COLLECTION], thread_facets),
+            _run_facets(get_db().alfred_feedback, feedback_facets)
+        ))
     except Exception as e:
         print(f"Error fetching overall stats with trends: {e}")
+        _skip_cache()
         # Return empty data instead of mock data
         return jsonify({
             'totalInteractions': 0,
@@ -217,47 +357,66 @@ def get_overall_stats():
             }
         })
 
+def _ratings_facets(days, now):
+    """alfred_feedback facets behind /ratings (all time when days is 0)"""
+    pipeline = [{'$project': {'feedback': 1, 'ts': _to_date('$timestamp')}}]
+    if days > 0:
+        pipeline.append({'$match': {'ts': {'$gte': now - timedelta(days=days)}}})
+    pipeline.append({'$group': {
+        '_id': None,
+        'good': {'$sum': {'$cond': [{'$eq': ['$feedback', 'good']}, 1, 0]}},
+        'bad': {'$sum': {'$cond': [{'$eq': ['$feedback', 'bad']}, 1, 0]}},
+        'neutral': {'$sum': {'$cond': [{'$eq': [{'$ifNull': ['$feedback', None]}, None]}, 1, 0]}}
+    }})
+    return {'ratings': pipeline}
+
+def _ratings_from_facets(results):
+    """Shape /ratings facet results into the rating distribution"""
+    counts = _first(results, 'ratings')
+    return {
+        'good': counts.get('good', 0),
+        'bad': counts.get('bad', 0),
+        'neutral': counts.get('neutral', 0)
+    }
+
+def _ratings_from_rollups(totals, days, window, now):
+    """Compute the /ratings payload from rollups (all time when window is 0)"""
+    if window > 0:
+        counts = {'good': 0, 'bad': 0, 'none': 0}
+        for i in range(window):
+            doc = days.get(day_key(now - timedelta(days=i)))
+            for key in counts:
+                counts[key] += doc.get('ratings', {}).get(key, 0) if doc else 0
+    else:
+        counts = totals.get('ratings', {})
+    return {
+        'good': counts.get('good', 0),
+        'bad': counts.get('bad', 0),
+        'neutral': counts.get('none', 0)
+    }
+
 @analytics.route('/ratings', methods=['GET'])
+@_cached('ratings')
 def get_ratings():
     """Get the distribution of response ratings (good, bad, neutral)"""
     # Get time period filter from query params (default: all time)
     days = request.args.get('days', default=0, type=int)
     
-    # Calculate date range if days specified
-    query = {}
-    if days > 0:
-        today = datetime.now()
-        start_date = today - timedelta(days=days)
-        query = {"timestamp": {"$gte": start_date}}
-    
     try:
-        # Get all interactions with ratings
-        interactions = list(db.alfred_feedback.find(query, {"feedback": 1}))
-        
-        # Count ratings
-        good_count = sum(1 for i in interactions if i.get('feedback') == 'good')
-        bad_count = sum(1 for i in interactions if i.get('feedback') == 'bad')
-        neutral_count = sum(1 for i in interactions if i.get('feedback') is None)
+        now = datetime.utcnow()
+        totals, rollup_days = read_rollups(get_db(), now - timedelta(days=max(days, 1) - 1), now)
+        if totals:
+            ratings = _ratings_from_rollups(totals, rollup_days, days, now)
+        else:
+            ratings = _ratings_from_facets(_run_facets(get_db().alfred_feedback, _ratings_facets(days, now)))
         
         # Print debug information
-        print(f"Ratings data - Good: {good_count}, Bad: {bad_count}, Neutral: {neutral_count}")
+        print(f"Ratings data - Good: {ratings['good']}, Bad: {ratings['bad']}, Neutral: {ratings['neutral']}")
         
-        # If no ratings are found at all, use fallback data
-        # if good_count == 0 and bad_count == 0 and neutral_count == 0:
-        #     print("No ratings found in DB, using fallback data")
-        #     return jsonify({
-        #         'good': 75,
-        #         'bad': 15,
-        #         'neutral': 10
-        #     })
-        
-        return jsonify({
-            'good': good_count,
-            'bad': bad_count,
-            'neutral': neutral_count
-        })
+        return jsonify(ratings)
     except Exception as e:
         print(f"Error fetching ratings: {e}")
+        _skip_cache()
         # Return mock data if DB query fails
         return jsonify({
             'good': 75,
@@ -265,421 +424,390 @@ def get_ratings():
             'neutral': 10
         })
 
+# Upper bound for the `limit` (number of buckets) query parameter
+MAX_BUCKETS = 10000
+
+BUCKET_PERIODS = ('daily', 'weekly', 'monthly')
+
+def _bucket_params():
+    """Read and clamp the period/limit query parameters shared by the time-series routes"""
+    period = request.args.get('period', default='monthly', type=str)
+    if period not in BUCKET_PERIODS:
+        # Unknown periods are treated as monthly everywhere (bucketing, labels and rollup window)
+        period = 'monthly'
+    limit = request.args.get('limit', default=7, type=int)  # Number of data points
+    return period, max(1, min(limit, MAX_BUCKETS))
+
+def _bucket_index(period, date_expr, now):
+    """
+    Aggregation expression numbering the period bucket a date falls in
+
+    0 is the current day/month (or the 7 days ending today), 1 the one
+    before it, and so on; dates in the future get negative numbers.
+    """
+    unit = 'month' if period == 'monthly' else 'day'
+    diff = {'$dateDiff': {'startDate': date_expr, 'endDate': now, 'unit': unit}}
+    if period == 'weekly':
+        return {'$floor': {'$divide': [diff, 7]}}
+    return diff
+
+def _bucket_label(period, index, now):
+    """Chart label for a bucket number"""
+    if period == 'daily':
+        return (now - timedelta(days=index)).strftime("%d %b")  # Format: "25 Apr"
+    if period == 'weekly':
+        return f"W{index + 1}"
+    month = now.month - 1 - index
+    return datetime(now.year + month // 12, month % 12 + 1, 1).strftime("%b")  # Short month name (e.g., "Apr")
+
+def _bucket_pipeline(period, limit, now, timestamp_field, fields, accumulators):
+    """
+    Pipeline grouping documents into the last `limit` period buckets in one pass
+
+    Args:
+        period (str): 'daily', 'weekly' or 'monthly'
+        limit (int): Number of buckets
+        now (datetime): End of the current bucket
+        timestamp_field (str): Field path holding the stored timestamp (e.g. '$timestamp')
+        fields (dict): Extra $project fields needed by the accumulators
+        accumulators (dict): $group accumulators computed per bucket
+
+    Returns:
+        list: Aggregation pipeline yielding one document per non-empty bucket ({_id: bucket number, ...})
+    """
+    project = {'bucket': _bucket_index(period, _to_date(timestamp_field), now)}
+    project.update(fields)
+    group = {'_id': '$bucket'}
+    group.update(accumulators)
+    return [
+        {'$project': project},
+        {'$match': {'bucket': {'$gte': 0, '$lt': limit}}},
+        {'$group': group}
+    ]
+
+def _bucket_series(period, limit, now, docs, value):
+    """
+    Zero-filled chart series, oldest bucket first
+
+    Args:
+        docs (list): Documents from _bucket_pipeline
+        value (callable): Maps a bucket's document (or None when empty) to its value
+    """
+    by_bucket = {int(doc['_id']): doc for doc in docs}
+    return [
+        {"date": _bucket_label(period, i, now), "value": value(by_bucket.get(i))}
+        for i in range(limit - 1, -1, -1)
+    ]
+
+def _bucket_first_day(period, limit, now):
+    """First day covered by the last `limit` buckets"""
+    if period == 'daily':
+        return now - timedelta(days=limit - 1)
+    if period == 'weekly':
+        return now - timedelta(days=limit * 7 - 1)
+    month = now.month - limit
+    return datetime(now.year + month // 12, month % 12 + 1, 1)
+
+def _rollup_bucket_docs(days, period, limit, now):
+    """
+    Sum day rollups into per-bucket documents shaped like _bucket_pipeline results
+
+    Returns:
+        dict: Facet results for interactions_over_time, comment_activity and response_quality
+    """
+    today = now.date()
+    buckets = {}
+    for key, doc in days.items():
+        day = datetime.strptime(key, '%Y-%m-%d').date()
+        if period == 'monthly':
+            index = (today.year - day.year) * 12 + today.month - day.month
+        else:
+            index = (today - day).days // (7 if period == 'weekly' else 1)
+        if not 0 <= index < limit:
+            continue
+        
+        ratings = doc.get('ratings', {})
+        bucket = buckets.setdefault(index, {'_id': index, 'count': 0, 'comments': 0, 'good': 0, 'bad': 0})
+        bucket['count'] += doc.get('feedback_docs', 0)
+        bucket['comments'] += doc.get('comments', 0)
+        bucket['good'] += ratings.get('good', 0)
+        bucket['bad'] += ratings.get('bad', 0)
+    
+    docs = list(buckets.values())
+    return {'interactions_over_time': docs, 'comment_activity': docs, 'response_quality': docs}
+
+def _bucket_results(facets, period, limit, now):
+    """Per-bucket results from the daily rollups when built, otherwise from the live facets"""
+    totals, rollup_days = read_rollups(get_db(), _bucket_first_day(period, limit, now), now)
+    if totals:
+        return _rollup_bucket_docs(rollup_days, period, limit, now)
+    return _run_facets(get_db().alfred_feedback, facets)
+
+def _interactions_over_time_facets(period, limit, now):
+    """alfred_feedback facets behind /interactions-over-time"""
+    return {
+        'interactions_over_time': _bucket_pipeline(period, limit, now, '$timestamp', {}, {'count': {'$sum': 1}})
+    }
+
+def _interactions_over_time_from_facets(results, period, limit, now):
+    """Shape /interactions-over-time facet results into a chart series"""
+    return _bucket_series(period, limit, now, results.get('interactions_over_time', []),
+                          lambda doc: doc['count'] if doc else 0)
+
 @analytics.route('/interactions-over-time', methods=['GET'])
+@_cached('interactions-over-time')
 def get_interactions_over_time():
-    """Get interaction counts over time (by day, week, or month)"""
-    # db = get_db()
-    
-    # Get parameters
-    period = request.args.get('period', default='monthly', type=str)  # daily, weekly, monthly
-    limit = request.args.get('limit', default=7, type=int)  # Number of data points
+    """
+    Get interaction counts over time (by day, week, or month)
+
+    Every bucket is counted by one grouped aggregation; empty buckets are
+    filled with zeros.
+    """
+    period, limit = _bucket_params()
+    now = datetime.utcnow()
     
     try:
-        # Get current date
-        today = datetime.now()
-        
-        if period == 'daily':
-            # Generate data for the last N days
-            data_points = []
-            for i in range(limit-1, -1, -1):
-                day_date = today - timedelta(days=i)
-                day_str = day_date.strftime("%d %b")  # Format: "25 Apr"
-                
-                # Query interactions for this day
-                day_start = day_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                
-                try:
-                    # Count interactions
-                    count = db.alfred_feedback.count_documents({
-                        "timestamp": {"$gte": day_start, "$lte": day_end}
-                    })
-                    
-                    data_points.append({
-                        "date": day_str,
-                        "value": count
-                    })
-                except Exception as e:
-                    print(f"Error counting daily interactions for {day_str}: {e}")
-                    # Use random data as fallback
-                    data_points.append({
-                        "date": day_str,
-                        "value": random.randint(10, 50)
-                    })
-            
-            return jsonify(data_points)
-            
-        elif period == 'weekly':
-            # Generate data for the last N weeks
-            data_points = []
-            for i in range(limit-1, -1, -1):
-                week_end = today - timedelta(days=i*7)
-                week_start = week_end - timedelta(days=6)
-                week_str = f"{week_start.strftime('%d %b')}-{week_end.strftime('%d %b')}"
-                
-                try:
-                    # Count interactions
-                    count = db.alfred_feedback.count_documents({
-                        "timestamp": {"$gte": week_start, "$lte": week_end}
-                    })
-                    
-                    data_points.append({
-                        "date": f"W{i+1}",
-                        "value": count
-                    })
-                except Exception as e:
-                    print(f"Error counting weekly interactions for {week_str}: {e}")
-                    # Use random data as fallback
-                    data_points.append({
-                        "date": f"W{i+1}",
-                        "value": random.randint(50, 200)
-                    })
-            
-            return jsonify(data_points)
-            
-        else:  # monthly (default)
-            # Generate last N months
-            data_points = []
-            for i in range(limit-1, -1, -1):
-                month_date = today - timedelta(days=30 * i)
-                month_name = month_date.strftime("%b")  # Short month name (e.g., "Apr")
-                
-                try:
-                    # This is a simplified approach - in production, you'd use proper month start/end dates
-                    month_start = datetime(month_date.year, month_date.month, 1)
-                    if month_date.month == 12:
-                        month_end = datetime(month_date.year + 1, 1, 1) - timedelta(days=1)
-                    else:
-                        month_end = datetime(month_date.year, month_date.month + 1, 1) - timedelta(days=1)
-                    
-                    # Count interactions
-                    count = db.alfred_feedback.count_documents({
-                        "timestamp": {"$gte": month_start, "$lte": month_end}
-                    })
-                    
-                    # Use actual count without artificial adjustment
-                    data_points.append({
-                        "date": month_name,
-                        "value": count
-                    })
-                except Exception as e:
-                    print(f"Error counting monthly interactions for {month_name}: {e}")
-                    # Fallback to random data
-                    data_points.append({
-                        "date": month_name,
-                        "value": random.randint(120, 300)
-                    })
-            
-            return jsonify(data_points)
+        results = _bucket_results(_interactions_over_time_facets(period, limit, now), period, limit, now)
+        return jsonify(_interactions_over_time_from_facets(results, period, limit, now))
     except Exception as e:
         print(f"Error fetching interactions over time: {e}")
-        # Return mock data if DB query fails
-        mock_data = []
-        
-        if period == 'daily':
-            # Last 7 days
-            for i in range(7):
-                day = (today - timedelta(days=i)).strftime("%d %b")
-                mock_data.append({"date": day, "value": 0})
-        elif period == 'weekly':
-            # Last 7 weeks
-            for i in range(7):
-                mock_data.append({"date": f"W{i+1}", "value": 0})
-        else:
-            # Last 7 months
-            months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul"]
-            for month in months:
-                mock_data.append({"date": month, "value": 0})
-        
-        # Reverse to have chronological order
-        mock_data.reverse()
-        return jsonify(mock_data)
+        _skip_cache()
+        # Return an empty (all zero) series if the DB query fails
+        return jsonify(_bucket_series(period, limit, now, [], lambda doc: 0))
+
+def _comment_activity_facets(period, limit, now):
+    """alfred_feedback facets behind /comment-activity"""
+    comment_count = {'$size': {'$ifNull': ['$comments', []]}}
+    return {
+        'comment_activity': _bucket_pipeline(period, limit, now, '$timestamp',
+                                             {'comment_count': comment_count},
+                                             {'comments': {'$sum': '$comment_count'}})
+    }
+
+def _comment_activity_from_facets(results, period, limit, now):
+    """Shape /comment-activity facet results into a chart series"""
+    return _bucket_series(period, limit, now, results.get('comment_activity', []),
+                          lambda doc: doc['comments'] if doc else 0)
 
 @analytics.route('/comment-activity', methods=['GET'])
+@_cached('comment-activity')
 def get_comment_activity():
-    """Get comment activity over time"""
-    # Get parameters
-    period = request.args.get('period', default='monthly', type=str)  # daily, weekly, monthly
-    limit = request.args.get('limit', default=7, type=int)  # Number of data points
+    """
+    Get comment activity over time
+
+    Comments are summed per bucket server-side in one grouped aggregation,
+    so the cost no longer multiplies documents by buckets.
+    """
+    period, limit = _bucket_params()
+    now = datetime.utcnow()
     
     try:
-        # Current date for reference
-        today = datetime.now()
-        
-        # Get comment documents
-        comment_docs = list(db.alfred_feedback.find({"comments": {"$exists": True, "$ne": []}}))
-        
-        # Helper function to count comments for a time period
-        def count_comments_in_period(start_date, end_date):
-            comment_count = 0
-            for doc in comment_docs:
-                if "timestamp" in doc and isinstance(doc["timestamp"], datetime):
-                    if start_date <= doc["timestamp"] <= end_date:
-                        comment_count += len(doc.get("comments", []))
-            return comment_count
-        
-        # Initialize data points array
-        data_points = []
-        
-        if period == 'daily':
-            # Generate data for the last N days
-            for i in range(limit-1, -1, -1):
-                day_date = today - timedelta(days=i)
-                day_str = day_date.strftime("%d %b")
-                day_start = day_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                day_end = day_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                
-                # Count comments for this day
-                day_comment_count = count_comments_in_period(day_start, day_end)
-                
-                data_points.append({
-                    "date": day_str,
-                    "value": day_comment_count
-                })
-            
-        elif period == 'weekly':
-            # Generate data for the last N weeks
-            for i in range(limit-1, -1, -1):
-                week_end = today - timedelta(days=i*7)
-                week_start = week_end - timedelta(days=6)
-                
-                # Count comments for this week
-                week_comment_count = count_comments_in_period(week_start, week_end)
-                
-                data_points.append({
-                    "date": f"W{i+1}",
-                    "value": week_comment_count
-                })
-            
-        else:  # monthly (default)
-            # Generate last N months
-            for i in range(limit-1, -1, -1):
-                month_date = today - timedelta(days=30 * i)
-                
-                # This is a simplified approach - in production, you'd use proper month start/end dates
-                month_start = datetime(month_date.year, month_date.month, 1)
-                
-                # Get proper month end date
-                if month_date.month == 12:
-                    month_end = datetime(month_date.year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    month_end = datetime(month_date.year, month_date.month + 1, 1) - timedelta(days=1)
-                
-                month_end = month_end.replace(hour=23, minute=59, second=59, microsecond=999999)
-                
-                # Count comments for this month
-                month_comment_count = count_comments_in_period(month_start, month_end)
-                
-                data_points.append({
-                    "date": month_date.strftime("%b"),  # Short month name (e.g., "Apr")
-                    "value": month_comment_count
-                })
-        
-        return jsonify(data_points)
-        
+        results = _bucket_results(_comment_activity_facets(period, limit, now), period, limit, now)
+        return jsonify(_comment_activity_from_facets(results, period, limit, now))
     except Exception as e:
         print(f"Error fetching comment activity: {e}")
+        _skip_cache()
         # Return empty data
-        mock_data = []
-        today = datetime.now()
-        
-        if period == 'daily':
-            # Last N days
-            for i in range(limit-1, -1, -1):
-                day = (today - timedelta(days=i)).strftime("%d %b")
-                mock_data.append({"date": day, "value": 0})
-        elif period == 'weekly':
-            # Last N weeks
-            for i in range(limit-1, -1, -1):
-                mock_data.append({"date": f"W{i+1}", "value": 0})
-        else:
-            # Last N months
-            for i in range(limit-1, -1, -1):
-                month = (today - timedelta(days=30*i)).strftime("%b")
-                mock_data.append({"date": month, "value": 0})
-        
-        return jsonify(mock_data)
+        return jsonify(_bucket_series(period, limit, now, [], lambda doc: 0))
+
+def _response_quality_facets(period, limit, now):
+    """alfred_feedback facets behind /response-quality"""
+    return {
+        'response_quality': _bucket_pipeline(period, limit, now, '$timestamp', {'feedback': 1}, {
+            'good': {'$sum': {'$cond': [{'$eq': ['$feedback', 'good']}, 1, 0]}},
+            'bad': {'$sum': {'$cond': [{'$eq': ['$feedback', 'bad']}, 1, 0]}}
+        })
+    }
+
+def _quality_score(doc):
+    """Percentage of good ratings among a bucket's good and bad ratings"""
+    total_ratings = doc['good'] + doc['bad'] if doc else 0
+    return round(doc['good'] / total_ratings * 100, 1) if total_ratings > 0 else 0
+
+def _response_quality_from_facets(results, period, limit, now):
+    """Shape /response-quality facet results into a chart series"""
+    return _bucket_series(period, limit, now, results.get('response_quality', []), _quality_score)
 
 @analytics.route('/response-quality', methods=['GET'])
+@_cached('response-quality')
 def get_response_quality():
-    """Get response quality trends based on ratings"""
-    # Get parameters
-    period = request.args.get('period', default='monthly', type=str)  # daily, weekly, monthly
-    limit = request.args.get('limit', default=7, type=int)  # Number of data points
+    """
+    Get response quality trends based on ratings
+
+    Good and bad ratings are counted per bucket in one grouped aggregation,
+    so each bucket's score reflects only the ratings that fall in it.
+    """
+    period, limit = _bucket_params()
+    now = datetime.utcnow()
     
     try:
-        # Get interactions data first (reuse that logic)
-        interactions_response = get_interactions_over_time()
-        interactions_data = interactions_response.get_json()
-        
-        # Calculate quality scores based on good vs. bad ratings
-        quality_data = []
-        
-        for item in interactions_data:
-            date_label = item["date"]
-            
-            try:
-                # In a real implementation, you'd query with proper date filtering
-                good_count = db.alfred_feedback.count_documents({
-                    "feedback": "good"
-                })
-                bad_count = db.alfred_feedback.count_documents({
-                    "feedback": "bad"
-                })
-                
-                # Calculate quality score (% of good ratings)
-                total_ratings = good_count + bad_count
-                quality_score = (good_count / total_ratings * 100) if total_ratings > 0 else 0
-                
-                quality_data.append({
-                    "date": date_label,
-                    "value": round(quality_score, 1)
-                })
-            except Exception as e:
-                print(f"Error calculating quality for {date_label}: {e}")
-                # Fallback to actual quality score
-                quality_data.append({
-                    "date": date_label,
-                    "value": 0
-                })
-        
-        return jsonify(quality_data)
+        results = _bucket_results(_response_quality_facets(period, limit, now), period, limit, now)
+        return jsonify(_response_quality_from_facets(results, period, limit, now))
     except Exception as e:
         print(f"Error fetching response quality: {e}")
+        _skip_cache()
         # Return empty data instead of mock data
-        mock_data = []
-        
-        today = datetime.now()
-        if period == 'daily':
-            # Last 7 days
-            for i in range(7):
-                day = (today - timedelta(days=i)).strftime("%d %b")
-                mock_data.append({"date": day, "value": 0})
-        elif period == 'weekly':
-            # Last 7 weeks
-            for i in range(7):
-                mock_data.append({"date": f"W{i+1}", "value": 0})
-        else:
-            # Last 7 months
-            months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul"]
-            for month in months:
-                mock_data.append({"date": month, "value": 0})
-        
-        # Reverse to have chronological order
-        mock_data.reverse()
-        return jsonify(mock_data)
+        return jsonify(_bucket_series(period, limit, now, [], lambda doc: 0))
+
+# Key of a feedback document's message: the legacy message_id field, else the _id it is stored under
+_FEEDBACK_MESSAGE_KEY = {'$ifNull': ['$message_id', '$_id']}
+
+def _message_id_part(position):
+    """Aggregation expression for one part of a user_session_index message key"""
+    return {'$arrayElemAt': [{'$split': ['$message_key', '_']}, position]}
+
+def _feedback_key_stages(fields):
+    """
+    Stages projecting each feedback document's message key, user and session
+
+    The stored userid/session_id are used when present; otherwise they are
+    parsed from the user_session_index message key. Documents whose key is
+    not a string (e.g. ObjectId _ids without a message_id) are skipped.
+
+    Args:
+        fields (dict): Additional fields to keep
+    """
+    project = {'message_key': _FEEDBACK_MESSAGE_KEY, 'userid': 1, 'session_id': 1}
+    project.update(fields)
+    keys = {
+        'user': {'$ifNull': ['$userid', _message_id_part(0)]},
+        'session': {'$ifNull': ['$session_id', _message_id_part(1)]}
+    }
+    keys.update({field: 1 for field in fields})
+    keys['message_key'] = 1
+    return [
+        {'$project': project},
+        {'$match': {'message_key': {'$type': 'string'}}},
+        {'$project': keys}
+    ]
+
+def _user_ratios_facets():
+    """alfred_feedback facets behind /user-ratios"""
+    return {
+        'user_ratios': _feedback_key_stages({'comment_count': {'$size': {'$ifNull': ['$comments', []]}}}) + [
+            {'$group': {
+                '_id': '$user',
+                'messages': {'$sum': 1},
+                'comments': {'$sum': '$comment_count'}
+            }},
+            {'$match': {'comments': {'$gt': 0}}},
+            {'$sort': {'comments': -1, '_id': 1}}
+        ]
+    }
+
+def _user_ratios_from_facets(results):
+    """Shape /user-ratios facet results into pie chart slices"""
+    # Calculate ratios
+    user_ratios = []
+    colors = ["#8b5cf6", "#3b82f6", "#14b8a6", "#f97316", "#ec4899"]
+    
+    for i, doc in enumerate(results.get('user_ratios', [])):
+        ratio = doc['comments'] / doc['messages'] if doc['messages'] > 0 else 0
+        user_ratios.append({
+            "name": f"User {doc['_id']}",
+            "value": round(ratio * 100, 1),  # Convert to percentage
+            "color": colors[i % len(colors)]
+        })
+    
+    # If no data, return a single user with 100%
+    if not user_ratios:
+        user_ratios = [{
+            "name": "User us",
+            "value": 100,
+            "color": "#8b5cf6"
+        }]
+    return user_ratios
 
 @analytics.route('/user-ratios', methods=['GET'])
+@_cached('user-ratios')
 def get_user_comment_ratios():
-    """Get comment-to-message ratio by user"""
+    """
+    Get comment-to-message ratio by user
+
+    Feedback documents are grouped by user (stored userid, else the
+    message_id prefix) in a single aggregation instead of one find_one per
+    message.
+    """
     try:
-        # Get all message IDs
-        message_ids = db.alfred_feedback.distinct("message_id")
-        
-        # Group by user
-        user_comments = {}
-        user_messages = {}
-        
-        for msg_id in message_ids:
-            # Extract user ID from message_id format: user_id_session_id_index
-            parts = msg_id.split('_')
-            if len(parts) >= 1:
-                user_id = parts[0]
-                
-                # Count message
-                user_messages[user_id] = user_messages.get(user_id, 0) + 1
-                
-                # Check for comments
-                doc = db.alfred_feedback.find_one({"message_id": msg_id})
-                if doc and doc.get("comments") and len(doc.get("comments", [])) > 0:
-                    user_comments[user_id] = user_comments.get(user_id, 0) + len(doc.get("comments", []))
-        
-        # Calculate ratios
-        user_ratios = []
-        colors = ["#8b5cf6", "#3b82f6", "#14b8a6", "#f97316", "#ec4899"]
-        
-        for i, (user_id, comment_count) in enumerate(user_comments.items()):
-            message_count = user_messages.get(user_id, 0)
-            ratio = comment_count / message_count if message_count > 0 else 0
-            
-            user_ratios.append({
-                "name": f"User {user_id}",
-                "value": round(ratio * 100, 1),  # Convert to percentage
-                "color": colors[i % len(colors)]
-            })
-        
-        # If no data, return a single user with 100%
-        if not user_ratios:
-            user_ratios = [{
-                "name": "User us",
-                "value": 100,
-                "color": "#8b5cf6"
-            }]
-        
-        return jsonify(user_ratios)
+        return jsonify(_user_ratios_from_facets(_run_facets(get_db().alfred_feedback, _user_ratios_facets())))
     except Exception as e:
         print(f"Error fetching user comment ratios: {e}")
+        _skip_cache()
         # Return single user instead of mock data
         return jsonify([
             {"name": "User us", "value": 100, "color": "#8b5cf6"}
         ])
 
+def _feedback_insights_facets():
+    """alfred_feedback facets behind /feedback-insights"""
+    comment_count = {'$size': {'$ifNull': ['$comments', []]}}
+    return {
+        # Comments per user, reduced to the most active user plus totals for the average
+        'insights_users': _feedback_key_stages({'comment_count': comment_count}) + [
+            {'$group': {'_id': '$user', 'comments': {'$sum': '$comment_count'}}},
+            {'$match': {'comments': {'$gt': 0}}},
+            {'$sort': {'comments': -1, '_id': 1}},
+            {'$group': {
+                '_id': None,
+                'users': {'$sum': 1},
+                'comments': {'$sum': '$comments'},
+                'topUser': {'$first': '$_id'},
+                'topUserComments': {'$first': '$comments'}
+            }}
+        ],
+        # Session with the highest share of good ratings among its rated messages
+        'insights_sessions': _feedback_key_stages({'feedback': 1}) + [
+            {'$group': {
+                '_id': '$session',
+                'good': {'$sum': {'$cond': [{'$eq': ['$feedback', 'good']}, 1, 0]}},
+                'rated': {'$sum': {'$cond': [{'$in': ['$feedback', ['good', 'bad']]}, 1, 0]}}
+            }},
+            {'$match': {'rated': {'$gt': 0}, '_id': {'$ne': None}}},
+            {'$project': {'good': 1, 'rated': 1, 'ratio': {'$divide': ['$good', '$rated']}}},
+            {'$sort': {'ratio': -1, 'good': -1, '_id': 1}},
+            {'$limit': 1}
+        ],
+        'insights_message': _feedback_key_stages({'comment_count': comment_count}) + [
+            {'$match': {'comment_count': {'$gt': 0}}},
+            {'$sort': {'comment_count': -1, 'message_key': 1}},
+            {'$limit': 1}
+        ]
+    }
+
+def _feedback_insights_from_facets(results):
+    """Shape /feedback-insights facet results into the insights widget payload"""
+    users = _first(results, 'insights_users')
+    session = _first(results, 'insights_sessions')
+    message = _first(results, 'insights_message')
+
+    most_active_user = str(users.get('topUser', 'Unknown'))
+    avg_comments = users['comments'] / users['users'] if users.get('users') else 0
+    highest_rated_session = str(session.get('_id', 'Unknown'))
+    highest_rating = round(session['ratio'] * 100) if session else 0
+    most_commented_msg = message.get('message_key')
+    most_comments = message.get('comment_count', 0)
+
+    return {
+        "mostActiveUser": f"User {most_active_user} ({users.get('topUserComments', 0)} comments)",
+        "avgCommentsPerUser": round(avg_comments, 1),
+        "highestRatedSession": f"Session #{highest_rated_session[:4]} ({highest_rating}%)",
+        "mostCommentedMessage": f"ID: {most_commented_msg[:5] if most_commented_msg else 'None'} ({most_comments} comments)"
+    }
+
 @analytics.route('/feedback-insights', methods=['GET'])
+@_cached('feedback-insights')
 def get_feedback_insights():
-    """Get additional feedback insights and metrics"""
-    # db = get_db()
-    
+    """
+    Get additional feedback insights and metrics
+
+    Every insight comes from one $facet aggregation over a single scan of
+    alfred_feedback.
+    """
     try:
-        # Find the most active user
-        user_comments = {}
-        
-        # Aggregate comments by user
-        for doc in db.alfred_feedback.find({"comments": {"$exists": True, "$ne": []}}):
-            # Extract user ID from message_id
-            msg_id = doc.get("message_id", "")
-            # parts = msg_id.split('_')
-            # if len(parts) >= 1:
-            user_id = msg_id
-            user_comments[user_id] = user_comments.get(user_id, 0) + len(doc.get("comments", []))
-        
-        # Find most active user
-        most_active_user = max(user_comments.items(), key=lambda x: x[1], default=("Unknown", 0))
-        
-        # Calculate average comments per user
-        avg_comments = sum(user_comments.values()) / len(user_comments) if user_comments else 0
-        
-        # Find the highest rated session
-        # Simplified - would need proper aggregation in production
-        highest_rated_session = "Unknown"
-        highest_rating = 0
-        
-        for doc in db.alfred_feedback.find({"feedback": "good"}):
-            msg_id = doc.get("message_id", "")
-            parts = msg_id.split('_')
-            if len(parts) >= 2:
-                session_id = parts[1]
-                # More logic would be needed in production
-                highest_rated_session = session_id
-                highest_rating = 98  # Placeholder
-        
-        # Find most commented message
-        most_commented_msg = None
-        most_comments = 0
-        
-        for doc in db.alfred_feedback.find({"comments": {"$exists": True}}):
-            comments = doc.get("comments", [])
-            if len(comments) > most_comments:
-                most_comments = len(comments)
-                most_commented_msg = doc.get("message_id")
-        
-        return jsonify({
-            "mostActiveUser": f"User {most_active_user[0][:2]} ({most_active_user[1]} comments)",
-            "avgCommentsPerUser": round(avg_comments, 1),
-            "highestRatedSession": f"Session #{highest_rated_session[:4]} ({highest_rating}%)",
-            "mostCommentedMessage": f"ID: {most_commented_msg[:5] if most_commented_msg else 'None'} ({most_comments} comments)"
-        })
+        return jsonify(_feedback_insights_from_facets(_run_facets(get_db().alfred_feedback, _feedback_insights_facets())))
     except Exception as e:
         print(f"Error fetching feedback insights: {e}")
+        _skip_cache()
         # Return mock data
         return jsonify({
             "mostActiveUser": "User A (45 comments)",
@@ -688,6 +816,87 @@ def get_feedback_insights():
             "mostCommentedMessage": "ID: 5f3e9 (8 comments)"
         })
 
+@analytics.route('/dashboard', methods=['GET'])
+@_cached('dashboard')
+def get_dashboard():
+    """
+    Get every dashboard widget's data in one response
+
+    Accepts the same days/period/limit parameters as the individual routes
+    (days defaults to 30 for the stats trends and to all time for ratings,
+    as there). Time-based widgets come from one read of the daily rollups
+    when built; everything else is merged into one aggregation per
+    collection, so a dashboard load costs at most two scans.
+    """
+    days = request.args.get('days', type=int)
+    period, limit = _bucket_params()
+    now = datetime.utcnow()
+    
+    stats_days = max(1, 30 if days is None else days)
+    ratings_days = days or 0
+    
+    try:
+        # Time-based widgets come from one read of the daily rollups when they are built
+        first_day = min(now - timedelta(days=max(2 * stats_days, ratings_days) - 1), _bucket_first_day(period, limit, now))
+        totals, rollup_days = read_rollups(get_db(), first_day, now)
+        
+        feedback_facets = {}
+        feedback_facets.update(_user_ratios_facets())
+        feedback_facets.update(_feedback_insights_facets())
+        if not totals:
+            thread_facets, stats_feedback_facets = _stats_facets(stats_days, now)
+            feedback_facets.update(stats_feedback_facets)
+            feedback_facets.update(_ratings_facets(ratings_days, now))
+            feedback_facets.update(_interactions_over_time_facets(period, limit, now))
+            feedback_facets.update(_comment_activity_facets(period, limit, now))
+            feedback_facets.update(_response_quality_facets(period, limit, now))
+        
+        feedback_results = _run_facets(get_db().alfred_feedback, feedback_facets)
+        if totals:
+            stats = _stats_from_rollups(totals, rollup_days, stats_days, now)
+            ratings = _ratings_from_rollups(totals, rollup_days, ratings_days, now)
+            feedback_results.update(_rollup_bucket_docs(rollup_days, period, limit, now))
+        else:
+            stats = _stats_from_facets(_run_facets(get_db()[MONGO_COLLECTION], thread_facets), feedback_results)
+            ratings = _ratings_from_facets(feedback_results)
+        
+        return jsonify({
+            'stats': stats,
+            'ratings': ratings,
+            'interactionsOverTime': _interactions_over_time_from_facets(feedback_results, period, limit, now),
+            'commentActivity': _comment_activity_from_facets(feedback_results, period, limit, now),
+            'responseQuality': _response_quality_from_facets(feedback_results, period, limit, now),
+            'userRatios': _user_ratios_from_facets(feedback_results),
+            'feedbackInsights': _feedback_insights_from_facets(feedback_results)
+        })
+    except Exception as e:
+        print(f"Error fetching dashboard data: {e}")
+        _skip_cache()
+        # Empty widgets, like the individual routes' fallbacks, so the dashboard still renders
+        empty_series = _bucket_series(period, limit, now, [], lambda doc: 0)
+        return jsonify({
+            'stats': {
+                'totalInteractions': 0,
+                'activeUsers': 0,
+                'commentsCount': 0,
+                'ratingsCount': 0,
+                'responseRate': 0,
+                'trends': {
+                    'totalInteractions': 0,
+                    'activeUsers': 0,
+                    'commentsCount': 0,
+                    'ratingsCount': 0,
+                    'responseRate': 0
+                }
+            },
+            'ratings': {'good': 0, 'bad': 0, 'neutral': 0},
+            'interactionsOverTime': empty_series,
+            'commentActivity': empty_series,
+            'responseQuality': empty_series,
+            'userRatios': _user_ratios_from_facets({}),
+            'feedbackInsights': _feedback_insights_from_facets({})
+        })
+
 @analytics.route('/response-time', methods=['GET'])
 def get_response_time():
     """Get average response times by day of week"""
@@ -705,12 +914,12 @@ def get_response_time():
     ])
 
 @analytics.route('/chat-message-counts', methods=['GET'])
+@_cached('chat-message-counts')
 def get_chat_message_counts():
     """Get total count of all messages in chat histories across all sessions"""
     try:
         # Get collection from MongoDB
-        from db import MONGO_COLLECTION
-        collection = db[MONGO_COLLECTION]
+        collection = get_db()[MONGO_COLLECTION]
         
         # Initialize counters
         total_messages = 0
@@ -742,6 +951,7 @@ def get_chat_message_counts():
         })
     except Exception as e:
         print(f"Error calculating chat message counts: {e}")
+        _skip_cache()
         # Return empty data in case of error
         return jsonify({
             'totalMessages': 0,
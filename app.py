@@ -1,45 +1,73 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 import json
 import os
-from db import connect_to_mongodb, extract_chat_histories, save_to_json, MONGO_CLIENT, MONGO_COLLECTION
-from api.analytics import analytics
+from datetime import datetime
+import threading
+import uuid
+from db import (
+    get_db, extract_chat_histories, iter_chat_sessions, find_message, find_messages, list_users,
+    summarize_user_sessions, fetch_session, ensure_indexes, parse_timestamp, save_to_json,
+    close_client, MONGO_COLLECTION
+)
+from api.analytics import analytics, analytics_cache
+from cache import ChatSnapshotCache
+from conditional import finalize_response, not_modified, version_etag
+from encoding import FastJSONProvider, dumps
+from feedback import FeedbackResolver
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, init_app as init_metrics
+from rollups import apply_feedback_changes
+from sync import ChatSync, CHAT_SYNC
+from interactions import (
+    MAX_PAGE_SIZE, build_interaction_index, select_interactions,
+    materialize_interaction, encode_cursor, decode_cursor, normalize_timestamp
+)
 
-# Initialize MongoDB once at startup
-db_client, _ = connect_to_mongodb()
-if db_client is None:
-    raise RuntimeError('Failed to connect to MongoDB')
-db = db_client[MONGO_CLIENT]
+# MongoDB is reached through db.get_client()'s shared, lazily connected client
+feedback_resolver = FeedbackResolver(lambda: get_db()['alfred_feedback'])
 
 app = Flask(__name__, static_folder='static')
+# jsonify() everywhere (including the analytics blueprint) encodes through encoding.py
+app.json = FastJSONProvider(app)
 app.register_blueprint(analytics, url_prefix='/api')
+# Per-route latency and MongoDB usage; registered before any other hook and before the client exists
+request_metrics = Metrics()
+init_metrics(app, request_metrics)
 
-# Path to the JSON file containing chat histories
-# .
-def load_chat_data():
-    """Load chat data directly from MongoDB"""
-    try:
-        # Connect to MongoDB and extract data
-        # We're using the global db_client that was initialized at startup
-        # instead of creating a new connection each time
-        collection = db_client[MONGO_CLIENT][MONGO_COLLECTION]
-        
-        if collection is not None:
-            print("Fetching chat data directly from MongoDB...")
-            chat_data = extract_chat_histories(collection)
-            
-            if chat_data and len(chat_data) > 0:
-                print(f"Successfully loaded data for {len(chat_data)} users from MongoDB")
-                return chat_data
-            else:
-                print("No chat data found in MongoDB")
-                return {}
-        else:
-            print("Could not access MongoDB collection")
-            return {}
-    except Exception as e:
-        print(f"Error loading chat data from MongoDB: {e}")
-        # Return empty dict instead of None to avoid further errors
-        return {}
+def _extract_chat_data():
+    """
+    Extract chat data and its message index directly from MongoDB (used to build cache snapshots)
+
+    Errors propagate, so the cache keeps serving its previous snapshot
+    instead of publishing a partial one.
+    """
+    # We're using the shared process-wide client instead of creating a new connection each time
+    collection = get_db()[MONGO_COLLECTION]
+    
+    print("Fetching chat data directly from MongoDB...")
+    message_index = {}
+    chat_data = extract_chat_histories(collection, message_index)
+    
+    if chat_data:
+        print(f"Successfully loaded data for {len(chat_data)} users from MongoDB")
+    else:
+        print("No chat data found in MongoDB")
+    return chat_data, message_index
+
+# Shared snapshot of the chat data; call chat_cache.invalidate() after out-of-band data changes
+chat_cache = ChatSnapshotCache(_extract_chat_data)
+
+request_metrics.register_cache('chat', chat_cache.stats)
+request_metrics.register_cache('feedback', feedback_resolver.stats)
+request_metrics.register_cache('analytics', analytics_cache.stats)
+
+# Per-process token in snapshot ETags: each worker builds its own snapshots, and versions restart with the process
+_instance_tokens = {}
+
+def _snapshot_etag(snapshot):
+    """Strong ETag for a response built from a snapshot and the feedback map, for the current request"""
+    pid = os.getpid()
+    instance = _instance_tokens.setdefault(pid, uuid.uuid4().hex)
+    return version_etag(instance, snapshot.version, feedback_resolver.version)
 
 @app.route('/')
 def index():
@@ -48,323 +76,403 @@ def index():
 
 @app.route('/api/users')
 def get_users():
-    chat_data = load_chat_data()
-    if not chat_data:
+    """
+    List users with a valid userid
+
+    ?stats=1 adds each user's sessionCount and lastActivity, still computed
+    server-side in a single aggregation.
+    """
+    with_stats = request.args.get('stats', default=False, type=lambda value: value.lower() in ('1', 'true', 'yes'))
+    try:
+        collection = get_db()[MONGO_COLLECTION]
+        user_list = list_users(collection, with_stats=with_stats)
+    except Exception as e:
+        print(f"Error listing users: {e}")
         return jsonify([]), 200
     
-    user_list = []
-    
-    # Use the MongoDB collection directly to ensure we only get entities with user_id
-    collection = db_client[MONGO_CLIENT][MONGO_COLLECTION]
-    users = collection.find({"userid": {"$exists": True, "$ne": None, "$ne": ""}})
-    
-    for user in users:
-        user_id = str(user.get('userid'))
-        # Only add users with valid user_id
-        if user_id and user_id != "None":
-            user_list.append({"id": user_id})
-            print(f"Found user with valid user_id: {user_id}")
+    if with_stats:
+        for user in user_list:
+            if user['lastActivity'] is not None:
+                user['lastActivity'] = normalize_timestamp(user['lastActivity'])
     
+    print(f"Found {len(user_list)} users with valid user_id")
     return jsonify(user_list)
 
 
+def _session_summary(session_id, message_count, created_at, last_activity):
+    """Format a session summary, using 'Unknown' for missing timestamps"""
+    return {
+        "id": str(session_id),
+        "messageCount": message_count,
+        "createdAt": normalize_timestamp(created_at) if created_at else "Unknown",
+        "lastActivity": normalize_timestamp(last_activity) if last_activity else "Unknown"
+    }
+
+
+def _user_session_summaries(sessions):
+    """Summarize one user's snapshot sessions"""
+    user_summaries = []
+    for session_id, session_data in sessions.items():
+        messages = session_data.get('chat_history', [])
+        created_at = messages[0].get('timestamp') if messages else None
+        last_activity = messages[-1].get('timestamp') if messages else None
+        user_summaries.append(_session_summary(session_id, len(messages), created_at, last_activity))
+    return user_summaries
+
+
+def _build_session_summaries(snapshot):
+    """Precompute user_id -> session summaries for a snapshot"""
+    return {user_id: _user_session_summaries(sessions) for user_id, sessions in snapshot.data.items()}
+
+
+def _patch_session_summaries(summaries, snapshot, user_ids):
+    """Carry session summaries over to a patched snapshot, recomputing only the changed users"""
+    summaries = dict(summaries)
+    for user_id in user_ids:
+        summaries.pop(user_id, None)
+        if user_id in snapshot.data:
+            summaries[user_id] = _user_session_summaries(snapshot.data[user_id])
+    return summaries
+
+
+chat_cache.add_derived_patcher('session_summaries', _patch_session_summaries)
+
+# Optional incremental sync (CHAT_SYNC=auto|watch|poll) patches changed users into the snapshot
+chat_sync = None
+
+# Process that ran _init_database(); a forked worker runs it again for its own client and threads
+_initialized_pid = None
+_init_lock = threading.Lock()
+
+
+@app.before_request
+def _init_database():
+    """Create indexes and start the optional sync on a process's first request, not at import"""
+    global chat_sync, _initialized_pid
+    if _initialized_pid == os.getpid():
+        return
+    
+    with _init_lock:
+        if _initialized_pid == os.getpid():
+            return
+        ensure_indexes(get_db())
+        if CHAT_SYNC != 'off':
+            chat_sync = ChatSync(get_db()[MONGO_COLLECTION], chat_cache)
+            chat_sync.start()
+        _initialized_pid = os.getpid()
+
+
 @app.route('/api/users/<user_id>/sessions')
 def get_user_sessions(user_id):
-    chat_data = load_chat_data()
-    if not chat_data:
-        return jsonify([]), 200
+    """
+    List one user's sessions with message counts and first/last timestamps
 
-    # Check if user exists in our data
-    if user_id not in chat_data:
-        print(f"User not found: {user_id}")
-        return jsonify([]), 200
-    
-    print(f"Found user: {user_id}")
-    session_list = []
-    
-    # Get all sessions for this user
-    for session_id in chat_data[user_id].keys():
-        session_data = chat_data[user_id][session_id]
-        
-        # Check if this session uses the new schema format
-        if 'chat_history' not in session_data:
-            print(f"Skipping session {session_id} - old schema format")
-            continue
-            
-        messages = session_data.get('chat_history', [])
-        
-        # Calculate message count and timestamps
-        message_count = len(messages)
-        created_at = "Unknown"
-        last_activity = "Unknown"
-        
-        if message_count > 0:
-            # Try to get timestamps
-            if messages[0].get('timestamp'):
-                timestamp = messages[0].get('timestamp')
-                if isinstance(timestamp, dict) and '$date' in timestamp:
-                    created_at = timestamp['$date']
-                else:
-                    created_at = str(timestamp)
-            
-            if messages[-1].get('timestamp'):
-                timestamp = messages[-1].get('timestamp')
-                if isinstance(timestamp, dict) and '$date' in timestamp:
-                    last_activity = timestamp['$date']
-                else:
-                    last_activity = str(timestamp)
-        
-        session_list.append({
-            "id": session_id,
-            "messageCount": message_count,
-            "createdAt": created_at,
-            "lastActivity": last_activity
-        })
-        print(f"Found session with new schema: {session_id} with {message_count} messages")
+    Served from the snapshot's precomputed summaries while it is fresh,
+    otherwise from an aggregation scoped to this user.
+    """
+    etag = None
+    snapshot = chat_cache.peek()
+    if snapshot is not None:
+        etag = _snapshot_etag(snapshot)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        session_list = snapshot.derived('session_summaries', _build_session_summaries).get(user_id, [])
+    else:
+        try:
+            collection = get_db()[MONGO_COLLECTION]
+            session_list = [
+                _session_summary(doc.get('id', 'unknown'), doc['messageCount'], doc.get('createdAt'), doc.get('lastActivity'))
+                for doc in summarize_user_sessions(collection, user_id)
+            ]
+        except Exception as e:
+            print(f"Error summarizing sessions for user {user_id}: {e}")
+            return jsonify([]), 200
     
-    return jsonify(session_list)
+    print(f"Found {len(session_list)} sessions for user {user_id}")
+    response = jsonify(session_list)
+    if etag:
+        response.set_etag(etag)
+    return response
 
 
 @app.route('/api/users/<user_id>/sessions/<session_id>')
 def get_session_chat(user_id, session_id):
-    chat_data = load_chat_data()
-    if not chat_data:
-        return jsonify([]), 200
+    """
+    Return one session's messages merged with their feedback
+
+    The session comes from the fresh snapshot or a single $elemMatch fetch,
+    and feedback from one $or query, so this costs at most two round trips.
+    """
+    session_data = None
+    etag = None
+    snapshot = chat_cache.peek()
+    if snapshot is not None:
+        session_data = snapshot.data.get(user_id, {}).get(session_id)
+        if session_data is not None:
+            etag = _snapshot_etag(snapshot)
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
     
-    # Check if user exists
-    if user_id not in chat_data:
-        return jsonify([]), 200
+    if session_data is None:
+        # Not in the snapshot (or no fresh snapshot): fetch just this session
+        try:
+            collection = get_db()[MONGO_COLLECTION]
+            session_data = fetch_session(collection, user_id, session_id)
+        except Exception as e:
+            print(f"Error fetching session {session_id}: {e}")
     
-    # Check if session exists for this user
-    if session_id not in chat_data[user_id]:
+    if session_data is None:
         return jsonify([]), 200
     
     # Merge with feedback DB
-    session_data = chat_data[user_id][session_id]
     raw_msgs = session_data.get('chat_history', [])
     projects = session_data.get('projects', [])
     tasks = session_data.get('tasks', [])
     email_thread_chain = session_data.get('email_thread_chain', [])
     email_thread_id = session_data.get('email_thread_id', None)
-    fb_coll = db['alfred_feedback']
     
     # Build or extract message_ids
     msg_ids = [m.get('message_id') or f"{user_id}_{session_id}_{i}" for i, m in enumerate(raw_msgs)]
     
-    # Fetch existing feedback documents
-    # Try looking up feedback by both _id and message_id fields
-    fb_docs_by_id = list(fb_coll.find({'_id': {'$in': msg_ids}}))
-    fb_docs_by_msg_id = list(fb_coll.find({'message_id': {'$in': msg_ids}}))
-    
-    # Combine the results, prioritizing _id matches
-    fb_map = {doc['_id']: doc for doc in fb_docs_by_id}
-    
-    # Add message_id matches only if _id match doesn't exist
-    for doc in fb_docs_by_msg_id:
-        msg_id = doc['message_id']
-        if msg_id not in fb_map:
-            fb_map[msg_id] = doc
+    # Feedback matched by either _id or message_id, in at most one round trip
+    fb_map = feedback_resolver.resolve(msg_ids)
     
     print(f"Found {len(fb_map)} feedback documents for this session")
     
-    # Merge messages with feedback
+    # Merge messages with feedback in one pass; chat_history is already in sequence order
     merged_msgs = []
     for i, m in enumerate(raw_msgs):
-        msg_id = m.get('message_id')
-        if not msg_id:
-            msg_id = f"{user_id}_{session_id}_{i}"
-            m['message_id'] = msg_id  # Set it for future use
+        # msg_id only goes into the response rows; m belongs to the shared snapshot and must not change
+        msg_id = msg_ids[i]
             
+        # Datetimes are encoded as ISO strings by the JSON provider
         ts = m.get('timestamp', 'Unknown time')
         if isinstance(ts, dict) and 'date' in ts:
             ts = ts['date']
-        # Normalize timestamp to ISO string if datetime object
-        if hasattr(ts, 'isoformat'):
-            ts = ts.isoformat()
 
         # Get feedback data for this message
         fb_doc = fb_map.get(msg_id, {})
         feedback = fb_doc.get('feedback')
         comments = fb_doc.get('comments', [])
         
-        for role in m.get('messages', []):
+        roles = m.get('messages', [])
+        
+        # Function call details (the last function message wins), attached to assistant roles only
+        function_name = None
+        function_response = None
+        for func_msg in roles:
+            if func_msg.get('role') == 'function':
+                function_name = func_msg.get('name')
+                function_response = func_msg.get('content')
+        
+        for role in roles:
             role_data = role.get('role')
-            content = role.get('content')
-            
-            # Only include function_name and function_response for assistant messages
-            function_name = None
-            function_response = None
-            
-            if role_data == 'assistant':
-                # Look for function messages
-                for func_msg in m.get('messages', []):
-                    if func_msg.get('role') == 'function':
-                        function_name = func_msg.get('name')
-                        function_response = func_msg.get('content')
+            is_assistant = role_data == 'assistant'
             
-            msg_data = {
+            merged_msgs.append({
                 'id': msg_id,
                 'message_id': msg_id,  # Include both for compatibility
                 'role': role_data,
-                'content': content,
+                'content': role.get('content'),
                 'timestamp': ts,
                 'sequence': m.get('sequence', i),
                 'feedback': feedback,
                 'comments': comments,
-                'function_name': function_name,
-                'function_response': function_response
-            }
-            merged_msgs.append(msg_data)
-    
-    # Sort messages by sequence number first (most reliable), then by timestamp as fallback
-    try:
-        # First try to sort by sequence number which is most reliable
-        merged_msgs.sort(key=lambda x: x.get('sequence', float('inf')))
-    except Exception as e:
-        print(f"Error sorting messages by sequence: {e}")
-        # Fallback: try to sort by timestamp
-        try:
-            merged_msgs.sort(key=lambda x: x.get('timestamp', ''))
-        except Exception as e:
-            print(f"Error sorting messages by timestamp: {e}")
+                'function_name': function_name if is_assistant else None,
+                'function_response': function_response if is_assistant else None
+            })
 
     # Return all structured session data to frontend
-    return jsonify({
+    response = jsonify({
         'messages': merged_msgs,
         'projects': projects,
         'tasks': tasks,
         'email_thread_chain': email_thread_chain,
         'email_thread_id': email_thread_id
     })
+    if etag:
+        response.set_etag(etag)
+    return response
 
 @app.route('/api/interactions')
 def get_interactions():
-    chat_data = load_chat_data()
-    if not chat_data:
+    """
+    List user→assistant interactions with persisted feedback
+
+    Optional filters: user, function_name, rating, start, end (ISO-8601
+    timestamps or prefixes). Passing limit and/or after switches to keyset
+    pagination ordered by (timestamp, message_id) and returns
+    {"items": [...], "next_cursor": ...}; otherwise a plain list is returned.
+    """
+    args = request.args
+    paginated = 'limit' in args or 'after' in args
+    
+    limit = None
+    if paginated:
+        limit = args.get('limit', default=100, type=int)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    after = None
+    if args.get('after'):
+        try:
+            after = decode_cursor(args['after'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    rating = args.get('rating')
+    if rating is not None and rating not in ('good', 'bad', 'neutral'):
+        return jsonify({'error': 'Invalid rating value'}), 400
+    
+    try:
+        snapshot = chat_cache.get()
+    except Exception as e:
+        print(f"Error loading chat data: {e}")
+        return jsonify({"error": "Could not load chat data"}), 500
+    if not snapshot.data:
         print("No chat data available, returning empty list")
-        return jsonify([]), 200
+        return jsonify({'items': [], 'next_cursor': None} if paginated else []), 200
+    
+    etag = _snapshot_etag(snapshot)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     
     interactions = []
+    next_key = None
+    complete = True
     try:
-        for user_id, sessions in chat_data.items():
-            for session_id, session_data in sessions.items():
-                # Check if session uses the new schema format
-                if 'chat_history' not in session_data:
-                    continue
-                    
-                chat_history = session_data['chat_history']
-                
-                if not chat_history or not isinstance(chat_history, list):
-                    continue
-                
-                print(f"Processing session {session_id} with {len(chat_history)} chat history items")
-                
-                # Process each message in the chat history
-                for message in chat_history:
-                    # Validate message structure
-                    if not isinstance(message, dict) or 'messages' not in message:
-                        continue
-                    
-                    message_id = message.get('message_id')
-                    timestamp = message.get('timestamp')
-                    messages_list = message.get('messages', [])
-                    
-                    # Ensure timestamp is a string
-                    if isinstance(timestamp, dict) and '$date' in timestamp:
-                        timestamp = timestamp['$date']
-                    elif hasattr(timestamp, 'isoformat'):  # Python datetime object
-                        timestamp = timestamp.isoformat()
-                    
-                    # Find user and assistant messages
-                    user_content = None
-                    assistant_content = None
-                    function_name = None
-                    function_response = None
-                    
-                    for msg in messages_list:
-                        if msg.get('role') == 'user':
-                            user_content = msg.get('content')
-                        elif msg.get('role') == 'assistant':
-                            assistant_content = msg.get('content')
-                        elif msg.get('role') == 'function':
-                            function_name = msg.get('name')
-                            function_response = msg.get('content')
-                    
-                    # Only add to interactions if we have both user and assistant content
-                    if user_content and assistant_content:
-                        interactions.append({
-                            'id': message_id,  # Keep using 'id' for frontend compatibility
-                            'userPrompt': user_content,
-                            'aiResponse': assistant_content,
-                            'timestamp': str(timestamp),
-                            'agents': [],
-                            'function_name': function_name,
-                            'function_response': function_response,
-                            'rating': None,
-                            'comments': [],
-                            'user': {
-                                'name': user_id,
-                                'avatar': ''
-                            }
-                        })
+        index = snapshot.derived('interactions', build_interaction_index)
+        
+        # Narrow to rated messages with one projected query instead of overlaying feedback on everything;
+        # the sorted partition is reused until the snapshot (and so the index) or the feedback changes
+        rated = None
+        if rating is not None:
+            rated = index.subset(
+                rating, feedback_resolver.version, lambda: feedback_resolver.message_ids_with_feedback(rating)
+            )
+        
+        rows, next_key = select_interactions(
+            index,
+            after=after,
+            limit=limit,
+            user=args.get('user'),
+            function_name=args.get('function_name'),
+            start=args.get('start'),
+            end=args.get('end'),
+            partition=rated
+        )
+        interactions = [materialize_interaction(row) for row in rows]
     
     except Exception as e:
+        complete = False
         print(f"Error formatting interactions: {e}")
         import traceback
         traceback.print_exc()
     
     # Merge stored feedback/comments from DB
     try:
-        fb_coll = db['alfred_feedback']
-        
-        # Create a list of message IDs to query
-        msg_ids = [item['id'] for item in interactions if item['id']]
+        fb_map = feedback_resolver.resolve(item['id'] for item in interactions)
         
-        if msg_ids:
-            # Try looking up feedback by both _id and message_id fields
-            fb_docs_by_id = list(fb_coll.find({'_id': {'$in': msg_ids}}))
-            fb_docs_by_msg_id = list(fb_coll.find({'message_id': {'$in': msg_ids}}))
-            
-            # Combine the results, prioritizing _id matches
-            fb_map = {doc['_id']: doc for doc in fb_docs_by_id}
-            
-            # Add message_id matches only if _id match doesn't exist
-            for doc in fb_docs_by_msg_id:
-                msg_id = doc['message_id']
-                if msg_id not in fb_map:
-                    fb_map[msg_id] = doc
-            
-            # Update interactions with feedback data
-            for item in interactions:
-                if not item['id']:
-                    continue
-                    
-                doc = fb_map.get(item['id'], {})
+        # Update interactions with feedback data
+        for item in interactions:
+            doc = fb_map.get(item['id'])
+            if doc:
                 # override defaults if present
-                item['rating'] = doc.get('feedback', item.get('rating'))
-                item['comments'] = doc.get('comments', item.get('comments', []))
-                
-                print(f"Message {item['id']}: rating={item['rating']}, comments={item['comments']}")
+                item['rating'] = doc.get('feedback', item['rating'])
+                item['comments'] = doc.get('comments', item['comments'])
     except Exception as e:
+        complete = False
         print(f"Error merging feedback: {e}")
         import traceback
         traceback.print_exc()
     
     print(f"Returning {len(interactions)} interactions with persisted feedback")
-    return jsonify(interactions)
+    if paginated:
+        response = jsonify({
+            'items': interactions,
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        })
+    else:
+        response = jsonify(interactions)
+    # Partial results after an error get a body-hashed ETag instead, so they aren't revalidated as current
+    if complete:
+        response.set_etag(etag)
+    return response
+
+def _stream_ndjson(records):
+    """Encode records as newline-delimited JSON, one line at a time"""
+    try:
+        for record in records:
+            yield dumps(record) + b"\n"
+    except Exception as e:
+        # Headers are already sent; re-raising makes the server abort the chunked
+        # response, so the client sees a broken transfer rather than a short but valid body
+        print(f"Error streaming chat histories: {e}")
+        raise
+
+
+def _stream_json_array(records):
+    """Encode records as a JSON array, one element per chunk; no closing bracket is sent after an error"""
+    yield b"["
+    try:
+        for i, record in enumerate(records):
+            yield (b"," if i else b"") + dumps(record)
+    except Exception as e:
+        print(f"Error streaming chat histories: {e}")
+        raise
+    yield b"]"
+
 
 @app.route('/api/chat_histories')
 def chat_histories():
-    chat_data = load_chat_data()
-    if chat_data is None:
+    """
+    Return every user's sessions
+
+    ?format=ndjson streams one session per line and ?format=stream streams a
+    JSON array of sessions; both read straight from the Mongo cursor so memory
+    and time-to-first-byte don't grow with the collection. Without a format
+    the nested user_id -> session_id dict is returned.
+    """
+    output_format = request.args.get('format')
+    if output_format in ('ndjson', 'stream'):
+        collection = get_db()[MONGO_COLLECTION]
+        records = iter_chat_sessions(collection)
+        if output_format == 'ndjson':
+            return Response(_stream_ndjson(records), mimetype='application/x-ndjson')
+        return Response(_stream_json_array(records), mimetype='application/json')
+    
+    try:
+        snapshot = chat_cache.get()
+    except Exception as e:
+        print(f"Error loading chat data: {e}")
         return jsonify({"error": "Could not load chat data"}), 500
+    etag = _snapshot_etag(snapshot)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
     
-    return jsonify(chat_data)
+    response = jsonify(snapshot.data)
+    response.set_etag(etag)
+    return response
 
-@app.route('/api/comments', methods=['POST'])
-def add_comment():
-    data = request.get_json()
-    print(f"Received comment data: {data}")
+# Maximum number of operations accepted by POST /api/comments/batch
+MAX_FEEDBACK_BATCH = 1000
+
+
+def _feedback_ops(data):
+    """
+    Validate one rating/comment request and build its update operators
+
+    Args:
+        data (dict): Request item with message_id and optional comment/rating
+
+    Returns:
+        tuple: (message_id, ops, error message or None); ops is empty when there is nothing to change
+    """
+    if not isinstance(data, dict):
+        return None, {}, 'Operation must be an object'
     
     # Get the message_id which will now be used as _id
     doc_id = data.get('message_id')
@@ -376,45 +484,71 @@ def add_comment():
     
     # Basic validation
     if not doc_id:
-        return jsonify({'error': 'message_id required'}), 400
+        return doc_id, {}, 'message_id required'
     if has_rating and rating not in ('good','bad','neutral', None):
-        return jsonify({'error': 'Invalid rating value'}), 400
+        return doc_id, {}, 'Invalid rating value'
     if has_comment and comment is not None and not isinstance(comment, str):
-        return jsonify({'error': 'Comment must be a string'}), 400
+        return doc_id, {}, 'Comment must be a string'
+
+    ops = {}
+    if has_comment and comment:
+        ops.setdefault('$push', {})['comments'] = comment
+    if has_rating:
+        ops.setdefault('$set', {})['feedback'] = rating
+    return doc_id, ops, None
 
-    collection = db['alfred_feedback']
+
+def _set_on_insert(ops, message_data):
+    """Copy a message's owner, timestamp and role contents into ops' $setOnInsert"""
+    if not message_data:
+        return
+    
+    # Store the owning user and session so analytics can group without parsing ids
+    ops.setdefault('$setOnInsert', {})['userid'] = message_data.get('user_id')
+    ops['$setOnInsert']['session_id'] = message_data.get('session_id')
+    # Dates the feedback for the time-based analytics and daily rollups
+    ops['$setOnInsert']['timestamp'] = parse_timestamp(message_data.get('timestamp')) or datetime.utcnow()
+    
+    # For each role, add the corresponding content
+    for role_data in message_data.get('roles', []):
+        role = role_data.get('role')
+        if role == 'user':
+            ops['$setOnInsert']['user'] = role_data.get('content', '')
+        elif role == 'assistant':
+            ops['$setOnInsert']['assistant'] = role_data.get('content', '')
+        elif role == 'function':
+            ops['$setOnInsert']['function_name'] = role_data.get('name', '')
+            ops['$setOnInsert']['function_response'] = role_data.get('content', '')
+
+
+def _after_feedback_writes(changes):
+    """Drop memoized analytics and apply the writes' deltas to the daily rollups; the writes already succeeded"""
+    analytics_cache.invalidate()
+    try:
+        apply_feedback_changes(get_db(), changes)
+    except Exception as e:
+        # `python rollups.py` repairs any drift
+        print(f"Error updating analytics rollups: {e}")
+
+
+@app.route('/api/comments', methods=['POST'])
+def add_comment():
+    data = request.get_json()
+    print(f"Received comment data: {data}")
+    
+    doc_id, ops, error = _feedback_ops(data)
+    if error:
+        return jsonify({'error': error}), 400
 
     try:
-        ops = {}
-        if has_comment and comment:
-            ops.setdefault('$push', {})['comments'] = comment
-        if has_rating:
-            ops.setdefault('$set', {})['feedback'] = rating
-            
         # Only create a new document if we actually have changes to make
         if ops:
             # Find the message in email_threads to copy its data
-            message_data = get_message_data(doc_id)
+            _set_on_insert(ops, get_message_data(doc_id))
             
-            # Set the operation to create new documents with data from email_threads
-            if message_data:
-                # For each role, add the corresponding content
-                for role_data in message_data.get('roles', []):
-                    role = role_data.get('role')
-                    if role == 'user':
-                        ops.setdefault('$setOnInsert', {})['user'] = role_data.get('content', '')
-                    elif role == 'assistant':
-                        ops.setdefault('$setOnInsert', {})['assistant'] = role_data.get('content', '')
-                    elif role == 'function':
-                        ops.setdefault('$setOnInsert', {})['function_name'] = role_data.get('name', '')
-                        ops.setdefault('$setOnInsert', {})['function_response'] = role_data.get('content', '')
-            
-            # Use update with upsert to create or modify the document
-            result = collection.update_one(
-                {'_id': doc_id},  # Use message_id as _id
-                ops,
-                upsert=True
-            )
+            # Upsert with message_id as _id; the resolver's feedback map is updated in place
+            before, after = feedback_resolver.write(doc_id, ops)
+            _after_feedback_writes([(before, after)])
 
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -422,37 +556,112 @@ def add_comment():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/comments/batch', methods=['POST'])
+def add_comments_batch():
+    """
+    Apply many rating/comment operations with one unordered bulk_write
+
+    Accepts a JSON list (or {"operations": [...]}) of the same objects as
+    POST /api/comments. Operations on the same message_id are merged in
+    order. Message contents for new documents come from the message index
+    plus one lookup for any misses. Returns one result per operation, in
+    request order.
+    """
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        return jsonify({'error': 'Expected a list of operations'}), 400
+    if len(operations) > MAX_FEEDBACK_BATCH:
+        return jsonify({'error': f'At most {MAX_FEEDBACK_BATCH} operations per batch'}), 400
+
+    results = []
+    merged = {}
+    positions = {}
+    for position, item in enumerate(operations):
+        doc_id, ops, error = _feedback_ops(item)
+        results.append({'message_id': doc_id, 'success': error is None})
+        if error:
+            results[-1]['error'] = error
+            continue
+        if not ops:
+            continue
+        
+        target = merged.setdefault(doc_id, {})
+        for field, value in ops.get('$push', {}).items():
+            target.setdefault('$push', {}).setdefault(field, {'$each': []})['$each'].append(value)
+        target.setdefault('$set', {}).update(ops.get('$set', {}))
+        if not target['$set']:
+            del target['$set']
+        positions.setdefault(doc_id, []).append(position)
+
+    try:
+        if merged:
+            message_data = get_messages_data(list(merged))
+            for doc_id, ops in merged.items():
+                _set_on_insert(ops, message_data.get(doc_id))
+            
+            writes = list(merged.items())
+            written, errors = feedback_resolver.write_many(writes)
+            for index, error in errors.items():
+                for position in positions[writes[index][0]]:
+                    results[position].update({'success': False, 'error': error})
+            _after_feedback_writes([change for change in written if change is not None])
+    except Exception as e:
+        print(f"Error saving comment batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    failed = sum(1 for result in results if not result['success'])
+    return jsonify({'results': results, 'succeeded': len(results) - failed, 'failed': failed}), 200
+
+
+def get_messages_data(message_ids):
+    """
+    Look up many messages' location, timestamp and role contents by message_id
+
+    Served from the snapshot's message index; the misses are fetched with a
+    single aggregation and indexed.
+
+    Returns:
+        dict: message_id -> entry for the messages that exist
+    """
+    snapshot = chat_cache.peek()
+    index = snapshot.message_index if snapshot is not None else {}
+    entries = {message_id: index[message_id] for message_id in message_ids if message_id in index}
+    
+    missing = [message_id for message_id in message_ids if message_id not in entries]
+    if missing:
+        try:
+            found = find_messages(get_db()[MONGO_COLLECTION], missing)
+        except Exception as e:
+            print(f"Error retrieving message data: {e}")
+            found = {}
+        entries.update(found)
+        if snapshot is not None:
+            index.update(found)
+    return entries
+
+
 def get_message_data(message_id):
     """
-    Extracts message data from email_threads collection based on message_id
+    Look up a message's location, timestamp and role contents by message_id
+
+    Served from the snapshot's message index; on a miss (or with no fresh
+    snapshot) a single targeted query is made and its result indexed.
     """
     try:
-        # Load chat data
-        chat_data = load_chat_data()
+        snapshot = chat_cache.peek()
+        if snapshot is not None and message_id in snapshot.message_index:
+            return snapshot.message_index[message_id]
         
-        # Search for the message with the given ID
-        for user_id, user_data in chat_data.items():
-            for session_id, session_data in user_data.get('sessions', {}).items():
-                chat_history = session_data.get('chat_history', [])
-                
-                for chat_item in chat_history:
-                    if chat_item.get('message_id') == message_id:
-                        # Found the message
-                        return {
-                            'timestamp': chat_item.get('timestamp'),
-                            'roles': [
-                                {
-                                    'role': msg.get('role'),
-                                    'content': msg.get('content', ''),
-                                    'name': msg.get('name', '') if msg.get('role') == 'function' else None
-                                }
-                                for msg in chat_item.get('messages', [])
-                            ]
-                        }
+        collection = get_db()[MONGO_COLLECTION]
+        entry = find_message(collection, message_id)
+        if entry is None:
+            print(f"Message with ID {message_id} not found in chat data")
+            return {}
         
-        # Message not found
-        print(f"Message with ID {message_id} not found in chat data")
-        return {}
+        if snapshot is not None:
+            snapshot.message_index[message_id] = entry
+        return entry
     
     except Exception as e:
         print(f"Error retrieving message data: {e}")
@@ -461,14 +670,8 @@ def get_message_data(message_id):
 @app.route('/api/message/<message_id>')
 def get_message_feedback(message_id):
     try:
-        # Query feedback collection using message_id as _id
-        fb_coll = db['alfred_feedback']
-        doc = fb_coll.find_one({'_id': message_id})
-        
-        if not doc:
-            # If no feedback document exists with the message_id as _id,
-            # try looking it up by message_id field (for backward compatibility)
-            doc = fb_coll.find_one({'message_id': message_id})
+        # Feedback by _id, falling back to the legacy message_id field
+        doc = feedback_resolver.get(message_id)
         
         # Get original message data
         message_data = get_message_data(message_id)
@@ -498,13 +701,60 @@ def get_message_feedback(message_id):
         print(f"Error retrieving message feedback: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/_status')
+def get_status():
+    """Report chat cache, feedback resolver, analytics cache and incremental sync counters"""
+    return jsonify({
+        'chatCache': chat_cache.stats(),
+        'feedback': feedback_resolver.stats(),
+        'analytics': analytics_cache.stats(),
+        'sync': chat_sync.stats() if chat_sync is not None else None
+    })
+
+@app.route('/api/_metrics')
+def get_metrics():
+    """Request latency, MongoDB round trips/documents/bytes and cache hit rates in Prometheus text format"""
+    return Response(request_metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.after_request
 def after_request(response):
+    # ETag/If-None-Match (304) and negotiated gzip/brotli for GET responses
+    response = finalize_response(response)
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
+    response.headers.add('Access-Control-Expose-Headers', 'ETag')
     return response
 
+def warm_caches():
+    """
+    Prepare this process to serve traffic: indexes, optional sync, and a
+    freshly built chat snapshot with its derived structures
+
+    Called by gunicorn's post_fork hook (see gunicorn.conf.py) so every
+    worker answers its first request from a warm cache.
+    """
+    _init_database()
+    snapshot = chat_cache.refresh()
+    snapshot.derived('session_summaries', _build_session_summaries)
+    snapshot.derived('interactions', build_interaction_index)
+    return snapshot
+
+def release_resources():
+    """
+    Stop the optional sync and close this process's MongoDB client
+
+    Called by gunicorn's worker_exit hook (see gunicorn.conf.py) so an
+    exiting worker closes its pooled connections instead of leaving them
+    for the server to time out.
+    """
+    global chat_sync
+    if chat_sync is not None:
+        chat_sync.stop()
+        chat_sync = None
+    close_client()
+
 if __name__ == '__main__':
+    # Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
     # Use a different port than the React app
     app.run(debug=True, port=3002)
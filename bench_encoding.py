@@ -0,0 +1,152 @@
+"""
+JSON Encoding Benchmark
+
+Encodes synthetic payloads shaped like the largest API responses
+(/api/chat_histories, /api/interactions and a long session from
+get_session_chat()) with every available encoder, and reports the best
+encode time and the peak memory allocated while encoding.
+
+    python bench_encoding.py --users 200 --sessions 10 --messages 20
+
+No database is needed.
+"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import encoding
+
+
+def build_chat_data(users, sessions, messages):
+    """Build a nested user_id -> session_id -> session dict like the chat snapshot"""
+    started = datetime(2024, 1, 1)
+    data = {}
+    for u in range(users):
+        user_sessions = data[f"user{u}"] = {}
+        for s in range(sessions):
+            chat_history = []
+            for m in range(messages):
+                chat_history.append({
+                    'message_id': f"user{u}_s{s}_{m}",
+                    'timestamp': started + timedelta(minutes=u * sessions * messages + s * messages + m),
+                    'sequence': m,
+                    'messages': [
+                        {'role': 'user', 'content': f"Please draft an email about item {m} " * 4},
+                        {'role': 'function', 'name': 'send_email', 'content': '{"status": "sent", "id": %d}' % m},
+                        {'role': 'assistant', 'content': f"Here is a draft for item {m}. " * 12}
+                    ]
+                })
+            user_sessions[f"s{s}"] = {
+                'chat_history': chat_history,
+                'projects': [{'_id': ObjectId(), 'name': 'project'}],
+                'tasks': [],
+                'email_thread_chain': [],
+                'email_thread_id': None
+            }
+    return data
+
+
+def build_payloads(users, sessions, messages):
+    """
+    Build the benchmark payloads
+
+    Returns:
+        dict: name -> object as passed to jsonify() by the matching route
+    """
+    data = build_chat_data(users, sessions, messages)
+
+    interactions = []
+    for user_id, user_sessions in data.items():
+        for session in user_sessions.values():
+            for item in session['chat_history']:
+                roles = {msg['role']: msg for msg in item['messages']}
+                interactions.append({
+                    'id': item['message_id'],
+                    'userPrompt': roles['user']['content'],
+                    'aiResponse': roles['assistant']['content'],
+                    'timestamp': item['timestamp'],
+                    'agents': [],
+                    'function_name': roles['function']['name'],
+                    'function_response': roles['function']['content'],
+                    'rating': None,
+                    'comments': [],
+                    'user': {'name': user_id, 'avatar': ''}
+                })
+
+    # One long session, as returned by get_session_chat()
+    long_session = build_chat_data(1, 1, messages * 50)['user0']['s0']
+    session_messages = [
+        {
+            'id': item['message_id'],
+            'message_id': item['message_id'],
+            'role': msg['role'],
+            'content': msg['content'],
+            'timestamp': item['timestamp'],
+            'sequence': item['sequence'],
+            'feedback': None,
+            'comments': [],
+            'function_name': None,
+            'function_response': None
+        }
+        for item in long_session['chat_history'] for msg in item['messages']
+    ]
+
+    return {
+        'chat_histories': data,
+        'interactions': interactions,
+        'session_chat': {'messages': session_messages, 'projects': long_session['projects'], 'tasks': []}
+    }
+
+
+def encoders():
+    """Return name -> encode function for every available encoder"""
+    flask_default = DefaultJSONProvider(Flask(__name__))
+    # Flask's provider (sorted keys) can't encode ObjectId on its own, so it borrows our fallback
+    available = {'flask-default': lambda obj: flask_default.dumps(obj, default=encoding.default).encode()}
+    for name, (dumps, _) in encoding.ENCODERS.items():
+        available[name] = dumps
+    return available
+
+
+def measure(dumps, payload, repeat):
+    """
+    Time and trace one encoder on one payload
+
+    Returns:
+        tuple: (best seconds, peak bytes allocated, output bytes)
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = dumps(payload)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    output = dumps(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark JSON encoders on API-shaped payloads')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.users, args.sessions, args.messages)
+    print(f"Selected encoder: {encoding.ENCODER}")
+    print(f"{'payload':<16} {'encoder':<14} {'best ms':>9} {'peak MiB':>9} {'output MiB':>11}")
+    for payload_name, payload in payloads.items():
+        for encoder_name, dumps in encoders().items():
+            seconds, peak, size = measure(dumps, payload, args.repeat)
+            print(f"{payload_name:<16} {encoder_name:<14} {seconds * 1000:>9.1f} {peak / 2**20:>9.1f} {size / 2**20:>11.1f}")
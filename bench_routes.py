@@ -0,0 +1,439 @@
+"""
+Route Benchmark Suite
+
+Generates a synthetic email_threads/alfred_feedback dataset at one or more
+scales, loads it into MongoDB, and times every route in app.py and
+api/analytics.py through Flask's test client. For each route it reports the
+cold latency (empty caches), warm p50/p95 latency, the peak memory
+allocated by a cold request and the response size.
+
+    # Loads into the alfred_bench database (--db); refuses to replace existing data without --force
+    python bench_routes.py --mongo-uri mongodb://localhost:27017 --messages 1000 10000 100000
+
+    # In-memory stand-in (needs mongomock); no server required
+    python bench_routes.py --in-memory --messages 1000
+
+Save a run with --output and compare a later run against it with
+--baseline; the script exits with status 1 when a route got slower than
+--tolerance allows. mongomock doesn't implement every aggregation operator
+the analytics routes use ($convert, $dateDiff), so analytics numbers are
+only meaningful against a real mongod.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+import db
+from db import client_options, ensure_indexes, MONGO_COLLECTION
+
+FEEDBACK_COLLECTION = 'alfred_feedback'
+
+# Database the dataset is loaded into; never the application's own database by default
+BENCH_DATABASE = 'alfred_bench'
+
+# Documents per insert_many call while loading
+INSERT_BATCH_SIZE = 1000
+
+FUNCTION_NAMES = ('send_email', 'schedule_meeting', 'create_project_plan', 'assign_tasks')
+RATINGS = ('good', 'bad', 'neutral', None)
+
+
+def _chat_item(rng, message_id, timestamp):
+    """Build one chat_history item: a user prompt, a function call and the assistant's answer"""
+    function_name = rng.choice(FUNCTION_NAMES)
+    return {
+        'message_id': message_id,
+        'timestamp': timestamp,
+        'messages': [
+            {'role': 'user', 'content': f"Please {function_name.replace('_', ' ')} for item {message_id}. " * rng.randint(1, 4)},
+            {'role': 'function', 'name': function_name, 'content': json.dumps({'status': 'ok', 'id': message_id})},
+            {'role': 'assistant', 'content': f"Done: {function_name} for {message_id}. " * rng.randint(2, 12)}
+        ]
+    }
+
+
+def _feedback_doc(rng, user_id, session_id, item, legacy):
+    """Build an alfred_feedback document for a chat_history item, as POST /api/comments would store it"""
+    roles = {msg['role']: msg for msg in item['messages']}
+    doc = {
+        '_id': item['message_id'],
+        'userid': user_id,
+        'session_id': session_id,
+        'timestamp': item['timestamp'],
+        'feedback': rng.choice(RATINGS),
+        'comments': [f"Comment {n} on {item['message_id']}" for n in range(rng.randint(0, 2))],
+        'user': roles['user']['content'],
+        'assistant': roles['assistant']['content'],
+        'function_name': roles['function']['name'],
+        'function_response': roles['function']['content']
+    }
+    if legacy:
+        # Older documents are keyed by an ObjectId and carry the message id in a field
+        doc['message_id'] = doc['_id']
+        doc['_id'] = ObjectId()
+    return doc
+
+
+def generate_dataset(database, messages, sessions_per_user=10, messages_per_session=20,
+                     feedback_fraction=0.3, legacy_fraction=0.1, days=180, seed=0):
+    """
+    Replace email_threads and alfred_feedback with a synthetic dataset
+
+    Users own sessions_per_user sessions of messages_per_session chat_history
+    items each (the last user gets the remainder), with timestamps spread over
+    the last `days` days. A feedback_fraction of the items get a feedback
+    document; a legacy_fraction of those use the old message_id-field layout.
+
+    Args:
+        database (pymongo.database.Database): Database to load into
+        messages (int): Number of chat_history items to generate
+        sessions_per_user (int, optional): Defaults to 10.
+        messages_per_session (int, optional): Defaults to 20.
+        feedback_fraction (float, optional): Defaults to 0.3.
+        legacy_fraction (float, optional): Defaults to 0.1.
+        days (int, optional): Time span of the timestamps. Defaults to 180.
+        seed (int, optional): Random seed; the same seed gives the same dataset. Defaults to 0.
+
+    Returns:
+        dict: Counts of generated documents plus a 'sample' user, session and its message ids
+    """
+    rng = random.Random(seed)
+    threads = database[MONGO_COLLECTION]
+    feedback = database[FEEDBACK_COLLECTION]
+    threads.drop()
+    feedback.drop()
+
+    now = datetime.utcnow().replace(microsecond=0)
+    per_user = sessions_per_user * messages_per_session
+    user_docs, feedback_docs = [], []
+    counts = {'messages': messages, 'users': 0, 'sessions': 0, 'feedback': 0}
+    sample = None
+
+    generated = 0
+    while generated < messages:
+        user_id = f"user{counts['users']}"
+        sessions = []
+        for s in range(sessions_per_user):
+            if generated >= messages:
+                break
+            session_id = f"{user_id}_s{s}"
+            chat_history = []
+            # Sessions start anywhere in the span; their messages are two minutes apart
+            started = now - timedelta(days=days * rng.random(), minutes=2 * messages_per_session)
+            for m in range(min(messages_per_session, messages - generated)):
+                item = _chat_item(rng, f"{session_id}_{m}", started + timedelta(minutes=2 * m))
+                chat_history.append(item)
+                if rng.random() < feedback_fraction:
+                    feedback_docs.append(_feedback_doc(rng, user_id, session_id, item, rng.random() < legacy_fraction))
+                generated += 1
+            sessions.append({
+                'session_id': session_id,
+                'chat_history': chat_history,
+                'projects': [],
+                'tasks': [],
+                'email_thread_chain': [],
+                'email_thread_id': None
+            })
+        user_docs.append({'userid': user_id, 'sessions': sessions})
+        counts['users'] += 1
+        counts['sessions'] += len(sessions)
+
+        if sample is None:
+            first = sessions[0]
+            sample = {'user_id': user_id, 'session_id': first['session_id'],
+                      'message_ids': [item['message_id'] for item in first['chat_history']]}
+
+        if len(user_docs) * per_user >= INSERT_BATCH_SIZE:
+            threads.insert_many(user_docs)
+            user_docs = []
+        if len(feedback_docs) >= INSERT_BATCH_SIZE:
+            counts['feedback'] += len(feedback_docs)
+            feedback.insert_many(feedback_docs)
+            feedback_docs = []
+
+    if user_docs:
+        threads.insert_many(user_docs)
+    if feedback_docs:
+        counts['feedback'] += len(feedback_docs)
+        feedback.insert_many(feedback_docs)
+
+    counts['sample'] = sample
+    return counts
+
+
+def build_routes(sample, batch_size=100):
+    """
+    Return the requests to benchmark: every GET route, then the write routes
+
+    Args:
+        sample (dict): user_id, session_id and message_ids from generate_dataset()
+        batch_size (int, optional): Operations per /api/comments/batch request. Defaults to 100.
+
+    Returns:
+        list: (name, method, path, JSON body or None) tuples
+    """
+    user_id, session_id, message_ids = sample['user_id'], sample['session_id'], sample['message_ids']
+    message_id = message_ids[0]
+    reads = [
+        '/',
+        '/api/users',
+        '/api/users?stats=1',
+        f'/api/users/{user_id}/sessions',
+        f'/api/users/{user_id}/sessions/{session_id}',
+        '/api/interactions',
+        '/api/interactions?limit=100',
+        '/api/interactions?rating=good&limit=100',
+        '/api/chat_histories',
+        '/api/chat_histories?format=ndjson',
+        f'/api/message/{message_id}',
+        '/api/_status',
+        '/api/stats',
+        '/api/ratings',
+        '/api/interactions-over-time',
+        '/api/comment-activity',
+        '/api/response-quality',
+        '/api/user-ratios',
+        '/api/feedback-insights',
+        '/api/dashboard',
+        '/api/response-time',
+        '/api/chat-message-counts',
+    ]
+    routes = [(path, 'GET', path, None) for path in reads]
+
+    batch = [{'message_id': message_ids[n % len(message_ids)], 'rating': RATINGS[n % 3], 'comment': f"bench {n}"}
+             for n in range(batch_size)]
+    routes.append(('POST /api/comments', 'POST', '/api/comments',
+                   {'message_id': message_id, 'rating': 'good', 'comment': 'bench'}))
+    routes.append((f'POST /api/comments/batch ({batch_size})', 'POST', '/api/comments/batch', batch))
+    return routes
+
+
+def reset_caches(app_module):
+    """Empty every in-process cache so the next request does all of its work"""
+    app_module.chat_cache.invalidate()
+    app_module.feedback_resolver.clear()
+    app_module.analytics_cache.invalidate()
+
+
+def _request(client, method, path, body):
+    """Issue one request, returning (seconds, status code, response bytes)"""
+    started = time.perf_counter()
+    if method == 'GET':
+        response = client.get(path)
+    else:
+        response = client.post(path, json=body)
+    data = response.get_data()
+    return time.perf_counter() - started, response.status_code, len(data)
+
+
+def percentile(values, fraction):
+    """Return the value at a fraction (0-1) of the sorted values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def bench_route(app_module, client, method, path, body, repeat, trace_memory=True):
+    """
+    Time one route cold and warm, and trace the memory a cold request allocates
+
+    Args:
+        app_module (module): The imported app module (for its caches)
+        client (flask.testing.FlaskClient): Test client
+        method (str): 'GET' or 'POST'
+        path (str): Request path and query string
+        body: JSON body for POST requests
+        repeat (int): Number of warm requests
+        trace_memory (bool, optional): Run an extra cold request under tracemalloc. Defaults to True.
+
+    Returns:
+        dict: status, cold/p50/p95/max milliseconds, peak_mib and bytes
+    """
+    peak = None
+    if trace_memory:
+        reset_caches(app_module)
+        tracemalloc.start()
+        _request(client, method, path, body)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    reset_caches(app_module)
+    cold, status, size = _request(client, method, path, body)
+    warm = [_request(client, method, path, body)[0] for _ in range(repeat)]
+    return {
+        'status': status,
+        'cold_ms': cold * 1000,
+        'p50_ms': percentile(warm, 0.5) * 1000,
+        'p95_ms': percentile(warm, 0.95) * 1000,
+        'max_ms': max(warm) * 1000 if warm else 0.0,
+        'peak_mib': peak / 2**20 if peak is not None else None,
+        'bytes': size
+    }
+
+
+def max_rss_mib():
+    """Return this process's peak resident set size in MiB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def print_report(messages, results):
+    """Print one scale's per-route table"""
+    print(f"\n== {messages} messages ==")
+    print(f"{'route':<44} {'status':>6} {'cold ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak MiB':>9} {'KiB':>9}")
+    for name, result in results.items():
+        peak = f"{result['peak_mib']:.1f}" if result['peak_mib'] is not None else '-'
+        print(f"{name:<44} {result['status']:>6} {result['cold_ms']:>9.1f} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {peak:>9} {result['bytes'] / 2**10:>9.1f}")
+
+
+def compare(report, baseline, tolerance, floor_ms=2.0):
+    """
+    Find routes that got slower than a saved baseline
+
+    A route regresses when its cold or p50 latency exceeds the baseline's
+    by more than `tolerance` (a ratio) and by more than `floor_ms`, so
+    sub-millisecond noise isn't reported.
+
+    Args:
+        report (dict): This run's report
+        baseline (dict): A report saved with --output
+        tolerance (float): Allowed slowdown ratio, e.g. 1.25
+        floor_ms (float, optional): Smallest slowdown reported, in ms. Defaults to 2.0.
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    regressions = []
+    for scale, scale_report in report['scales'].items():
+        baseline_routes = baseline.get('scales', {}).get(scale, {}).get('routes', {})
+        for name, result in scale_report['routes'].items():
+            before = baseline_routes.get(name)
+            if not before:
+                continue
+            for metric in ('cold_ms', 'p50_ms'):
+                if result[metric] > before[metric] * tolerance and result[metric] - before[metric] > floor_ms:
+                    regressions.append(f"{scale} messages, {name}: {metric} {before[metric]:.1f} -> {result[metric]:.1f}")
+    return regressions
+
+
+def connect(args):
+    """Install the benchmark's client and database as the app's shared ones and return the database"""
+    if args.in_memory:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("--in-memory needs mongomock (pip install mongomock)")
+        db.use_client(mongomock.MongoClient(), args.db)
+    else:
+        db.use_client(MongoClient(args.mongo_uri, **client_options()), args.db)
+    return db.get_db()
+
+
+def check_empty(database):
+    """
+    Return the collections the benchmark would replace that already hold documents
+
+    Args:
+        database (pymongo.database.Database): Target database
+
+    Returns:
+        list: 'name (count)' strings for non-empty collections
+    """
+    occupied = []
+    for name in (MONGO_COLLECTION, FEEDBACK_COLLECTION, 'analytics_daily'):
+        count = database[name].estimated_document_count()
+        if count:
+            occupied.append(f"{name} ({count})")
+    return occupied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark every API route on a synthetic dataset')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--mongo-uri', help='mongod to load the dataset into (see --db)')
+    target.add_argument('--in-memory', action='store_true', help='Use an in-memory mongomock server')
+    parser.add_argument('--db', default=BENCH_DATABASE, help='Database to load the dataset into')
+    parser.add_argument('--force', action='store_true', help='Replace collections in --db that already hold documents')
+    parser.add_argument('--messages', type=int, nargs='+', default=[1000, 10000],
+                        help='Dataset sizes (chat_history items) to benchmark, e.g. 1000 100000 1000000')
+    parser.add_argument('--sessions-per-user', type=int, default=10)
+    parser.add_argument('--messages-per-session', type=int, default=20)
+    parser.add_argument('--feedback-fraction', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=10, help='Warm requests per route')
+    parser.add_argument('--rollups', action='store_true', help='Build the daily analytics rollups before timing')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass (faster on large scales)')
+    parser.add_argument('--verbose', action='store_true', help="Show the app's own output while timing")
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against a report saved with --output')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='Allowed slowdown ratio against the baseline')
+    args = parser.parse_args()
+
+    database = connect(args)
+    occupied = check_empty(database)
+    if occupied and not args.force:
+        sys.exit(f"Refusing to replace non-empty collections in {args.db}: {', '.join(occupied)}. "
+                 f"Use another --db, or --force if this is a scratch database.")
+
+    # Importing the app does no database I/O; it uses the client installed above
+    import app as app_module
+    from rollups import rebuild_rollups
+
+    client = app_module.app.test_client()
+    report = {'created_at': datetime.utcnow().isoformat(), 'scales': {}}
+
+    for messages in args.messages:
+        started = time.perf_counter()
+        counts = generate_dataset(database, messages, args.sessions_per_user, args.messages_per_session,
+                                  args.feedback_fraction, seed=args.seed)
+        database['analytics_daily'].drop()
+        ensure_indexes(database)
+        if args.rollups:
+            rebuild_rollups(database)
+        load_seconds = time.perf_counter() - started
+        print(f"Loaded {counts['users']} users, {counts['sessions']} sessions, {messages} messages and "
+              f"{counts['feedback']} feedback documents in {load_seconds:.1f}s")
+
+        results = {}
+        with open(os.devnull, 'w') as devnull:
+            # The routes print progress messages; keep them out of the report unless asked for
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                for name, method, path, body in build_routes(counts['sample']):
+                    results[name] = bench_route(app_module, client, method, path, body, args.repeat, not args.no_memory)
+        print_report(messages, results)
+
+        report['scales'][str(messages)] = {
+            'counts': {key: value for key, value in counts.items() if key != 'sample'},
+            'load_seconds': load_seconds,
+            'max_rss_mib': max_rss_mib(),
+            'routes': results
+        }
+        print(f"Peak RSS so far: {max_rss_mib():.0f} MiB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No route slower than {args.tolerance}x the baseline")
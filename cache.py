@@ -0,0 +1,374 @@
+"""
+In-process Chat Snapshot Cache
+
+This module keeps a versioned snapshot of the chat data extracted from
+the email_threads collection, so every API route shares one extraction
+instead of re-reading the whole collection on each request. ResultCache
+memoizes smaller computed results (e.g. analytics responses).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a snapshot stays fresh before the next read rebuilds it (0 disables caching)
+CHAT_CACHE_TTL = float(os.environ.get('CHAT_CACHE_TTL', 300))
+
+
+class ChatSnapshot:
+    """
+    A single extraction of the chat data
+
+    Attributes:
+        data (dict): Nested user_id -> session_id -> session data structure
+        message_index (dict): message_id -> location and role contents (see db.build_message_entry)
+        version (int): Monotonically increasing snapshot number
+        built_at (float): time.time() at which the snapshot was published
+        build_seconds (float): Time spent extracting the snapshot
+    """
+
+    def __init__(self, data, message_index, version, built_at, build_seconds):
+        self.data = data
+        self.message_index = message_index
+        self.version = version
+        self.built_at = built_at
+        self.build_seconds = build_seconds
+        self._derived = {}
+
+    def derived(self, name, builder):
+        """
+        Return a structure computed from this snapshot, building it once per version
+
+        Args:
+            name (str): Cache key for the derived structure
+            builder (callable): Function taking the snapshot and returning the structure
+
+        Returns:
+            The (possibly memoized) result of builder(self)
+        """
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived[name] = builder(self)
+        return value
+
+    def age(self):
+        """Seconds elapsed since the snapshot was published"""
+        return time.time() - self.built_at
+
+
+class ChatSnapshotCache:
+    """
+    Shared, versioned cache in front of the chat data loader
+
+    Readers get the current snapshot while it is younger than the TTL.
+    When it expires (or is invalidated) the next reader rebuilds it while
+    concurrent readers wait for that single rebuild. If the loader raises,
+    the previous snapshot (even a stale one) keeps being served under its
+    old version and the next reader retries.
+    """
+
+    def __init__(self, loader, ttl=CHAT_CACHE_TTL):
+        """
+        Args:
+            loader (callable): Function returning a (chat data, message index) tuple;
+                it must raise rather than return partial data
+            ttl (float, optional): Snapshot lifetime in seconds. Defaults to CHAT_CACHE_TTL.
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self._snapshot = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._hooks = []
+        self._derived_patchers = {}
+
+        # Counters reported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.failed_rebuilds = 0
+        self.patches = 0
+        self.invalidations = 0
+        self.last_rebuild_seconds = 0.0
+        self.total_rebuild_seconds = 0.0
+
+    def _is_fresh(self, snapshot):
+        return snapshot is not None and self.ttl > 0 and snapshot.age() < self.ttl
+
+    def get(self):
+        """
+        Return the current snapshot, rebuilding it if it is missing or stale
+
+        Returns:
+            ChatSnapshot: The current snapshot
+        """
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            # Another thread may have rebuilt while we waited for the lock
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                self.hits += 1
+                return snapshot
+
+            self.misses += 1
+            return self._rebuild()
+
+    def refresh(self):
+        """
+        Rebuild the snapshot now, e.g. to warm a freshly forked worker
+
+        Returns:
+            ChatSnapshot: The new snapshot, or the previous one if the loader failed
+        """
+        with self._lock:
+            return self._rebuild()
+
+    def peek(self):
+        """
+        Return the current snapshot only if it is fresh, never triggering a rebuild
+
+        Returns:
+            ChatSnapshot: The fresh snapshot, or None
+        """
+        snapshot = self._snapshot
+        return snapshot if self._is_fresh(snapshot) else None
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        try:
+            data, message_index = self.loader()
+        except Exception as e:
+            self.failed_rebuilds += 1
+            previous = self._snapshot
+            if previous is None:
+                raise
+            print(f"Failed to rebuild chat snapshot, still serving v{previous.version}: {e}")
+            return previous
+        elapsed = time.perf_counter() - started
+
+        self._version += 1
+        self.rebuilds += 1
+        self.last_rebuild_seconds = elapsed
+        self.total_rebuild_seconds += elapsed
+
+        snapshot = self._snapshot = ChatSnapshot(data, message_index, self._version, time.time(), elapsed)
+        print(f"Built chat snapshot v{snapshot.version} for {len(data)} users in {elapsed:.3f}s")
+        return snapshot
+
+    def patch(self, patcher, user_ids):
+        """
+        Publish a new snapshot derived from the current one without reloading everything
+
+        Derived structures with a registered patcher are carried over and
+        patched for the affected users; the rest are rebuilt on first use.
+
+        Args:
+            patcher (callable): Function taking the current snapshot and returning
+                the new (chat data, message index) tuple
+            user_ids (set): Users whose data the patcher changed
+
+        Returns:
+            ChatSnapshot: The new snapshot, or None if there was no snapshot to patch
+        """
+        with self._lock:
+            current = self._snapshot
+            if current is None:
+                return None
+
+            started = time.perf_counter()
+            data, message_index = patcher(current)
+            self._version += 1
+            self.patches += 1
+            snapshot = ChatSnapshot(data, message_index, self._version, time.time(), time.perf_counter() - started)
+            for name, value in current._derived.items():
+                derived_patcher = self._derived_patchers.get(name)
+                if derived_patcher is not None:
+                    snapshot._derived[name] = derived_patcher(value, snapshot, user_ids)
+            self._snapshot = snapshot
+            return snapshot
+
+    def add_derived_patcher(self, name, patcher):
+        """
+        Register how to carry a derived structure over to a patched snapshot
+
+        Args:
+            name (str): Name the structure is built under (see ChatSnapshot.derived)
+            patcher (callable): Function taking (previous value, new snapshot, user_ids)
+                and returning the value for the new snapshot
+        """
+        self._derived_patchers[name] = patcher
+
+    def touch(self):
+        """Mark the current snapshot as up to date, e.g. after a sync found no changes"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            snapshot.built_at = time.time()
+
+    def invalidate(self):
+        """Drop the current snapshot so the next read rebuilds it"""
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+        for hook in list(self._hooks):
+            try:
+                hook()
+            except Exception as e:
+                print(f"Error running cache invalidation hook: {e}")
+
+    def add_invalidation_hook(self, hook):
+        """
+        Register a callback run after every explicit invalidation
+
+        Args:
+            hook (callable): Zero-argument function, e.g. to clear a derived cache
+        """
+        self._hooks.append(hook)
+
+    @property
+    def version(self):
+        """Version of the most recently built snapshot (0 before the first build)"""
+        return self._version
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Hit/miss/rebuild counters, timings and the current version
+        """
+        snapshot = self._snapshot
+        lookups = self.hits + self.misses
+        return {
+            'version': self._version,
+            'ttl': self.ttl,
+            'age_seconds': round(snapshot.age(), 3) if snapshot else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'rebuilds': self.rebuilds,
+            'failed_rebuilds': self.failed_rebuilds,
+            'patches': self.patches,
+            'invalidations': self.invalidations,
+            'last_rebuild_seconds': round(self.last_rebuild_seconds, 4),
+            'total_rebuild_seconds': round(self.total_rebuild_seconds, 4)
+        }
+
+
+class ResultCache:
+    """
+    Bounded, thread-safe LRU map of computed results with per-entry TTLs
+
+    Entries are grouped under a name (e.g. a route) for hit-rate reporting.
+    invalidate() drops every entry, e.g. after a write the results depend on.
+    """
+
+    def __init__(self, max_entries):
+        """
+        Args:
+            max_entries (int): Entries kept before the least recently used is evicted (0 disables caching)
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Counters reported by stats()
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, name, key):
+        """
+        Look up a live entry
+
+        Args:
+            name (str): Entry group, e.g. the route
+            key (hashable): Key within the group
+
+        Returns:
+            tuple: (True, value) on a hit, (False, None) on a miss
+        """
+        with self._lock:
+            entry = self._entries.get((name, key))
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end((name, key))
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    return True, value
+                del self._entries[(name, key)]
+                self.expirations += 1
+            self.misses[name] = self.misses.get(name, 0) + 1
+            return False, None
+
+    def put(self, name, key, value, ttl, generation=None):
+        """
+        Store a value for `ttl` seconds
+
+        Args:
+            name (str): Entry group
+            key (hashable): Key within the group
+            value: Value to store
+            ttl (float): Lifetime in seconds
+            generation (int, optional): The generation read before computing the value;
+                if the cache was invalidated since, the (possibly stale) value is dropped
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[(name, key)] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end((name, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    @property
+    def generation(self):
+        """Counter bumped by every invalidate()"""
+        return self._generation
+
+    def invalidate(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: Overall and per-name hits, misses and hit rates, plus size and eviction counters
+        """
+        with self._lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            per_name = {}
+            for name in names:
+                hits = self.hits.get(name, 0)
+                lookups = hits + self.misses.get(name, 0)
+                per_name[name] = {
+                    'hits': hits,
+                    'misses': lookups - hits,
+                    'hit_rate': round(hits / lookups, 4) if lookups else 0
+                }
+            hits = sum(self.hits.values())
+            lookups = hits + sum(self.misses.values())
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': hits,
+                'misses': lookups - hits,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'routes': per_name
+            }
@@ -0,0 +1,140 @@
+"""
+Conditional GET and Response Compression
+
+This module implements strong ETags, If-None-Match handling and
+negotiated gzip/brotli compression for JSON responses. Routes served from
+a versioned snapshot compute their ETag from the version before doing any
+work, so an unchanged poll costs neither a query nor serialization. Other
+responses get an ETag hashed from their body in app.py's after_request hook.
+Compressed representations carry their own ETag ("<etag>-gzip"/"<etag>-br")
+so each encoding is validated separately.
+"""
+
+import gzip
+import hashlib
+import os
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# gzip level (1-9) and brotli quality (0-11); mid-range values favor speed on dynamic responses
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/html', 'text/plain')
+
+
+def version_etag(*parts):
+    """
+    Build a strong ETag for the current request from data version parts
+
+    The request path and query string are included, so each parameter
+    combination over the same data version gets its own tag.
+
+    Args:
+        *parts: Values identifying the data the response is built from
+
+    Returns:
+        str: Unquoted ETag value
+    """
+    key = '|'.join(str(part) for part in parts + (request.full_path,))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def body_etag(body):
+    """Return a strong ETag hashed from a response body"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _matching_tag(etag):
+    """
+    Return the variant of an ETag (plain, -gzip or -br) named by If-None-Match
+
+    Returns:
+        str: The matching tag, or None if the client's copy is out of date
+    """
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    for tag in (etag, f"{etag}-gzip", f"{etag}-br"):
+        if if_none_match.contains(tag):
+            return tag
+    return etag if if_none_match.star_tag else None
+
+
+def _not_modified_response(tag):
+    response = current_app.response_class(status=304)
+    response.set_etag(tag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def not_modified(etag):
+    """
+    Answer a conditional GET before building the response
+
+    Args:
+        etag (str): ETag the response would carry
+
+    Returns:
+        flask.Response: A 304 response if the client's copy is current, otherwise None
+    """
+    tag = _matching_tag(etag) if request.method in ('GET', 'HEAD') else None
+    return _not_modified_response(tag) if tag else None
+
+
+def _choose_encoding():
+    """Pick the best content-coding the client accepts: br, then gzip, else None"""
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def finalize_response(response):
+    """
+    Add an ETag, answer If-None-Match and compress a response
+
+    Responses that already carry an ETag keep it (version-based tags set by
+    routes). Streamed, error and non-JSON/text responses pass through.
+
+    Args:
+        response (flask.Response): Response from the view
+
+    Returns:
+        flask.Response: The response to send (possibly a new 304 response)
+    """
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    etag, _ = response.get_etag()
+    if etag is None:
+        etag = body_etag(body)
+
+    tag = _matching_tag(etag)
+    if tag:
+        return _not_modified_response(tag)
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        etag = f"{etag}-{encoding}"
+    response.set_etag(etag)
+    return response
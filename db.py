@@ -9,8 +9,9 @@ import pymongo
 from pymongo import MongoClient
 import pandas as pd
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 import os
+import threading
 from urllib.parse import quote_plus
 
 # Database connection constants
@@ -18,14 +19,120 @@ USER_NAME = "alfred"
 PASS = "alfred-coco-cola"
 MONGO_CLIENT = 'alfred-coco-cola'
 MONGO_COLLECTION = 'email_threads'
-MONGO_HOST = '172.178.91.142'
-MONGO_PORT = 27017
+MONGO_HOST = os.environ.get('MONGO_HOST', '172.178.91.142')
+MONGO_PORT = int(os.environ.get('MONGO_PORT', 27017))
+
+# Client settings (see get_client); empty values keep the driver defaults
+MONGO_URI = os.environ.get('MONGO_URI', '')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 0))
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+
+# Process-wide client, created lazily by get_client() and recreated after a fork
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def mongo_uri():
+    """Return the connection string: MONGO_URI if set, otherwise one built from the constants above"""
+    if MONGO_URI:
+        return MONGO_URI
+    username = quote_plus(USER_NAME)
+    password = quote_plus(PASS)
+    return f"mongodb://{username}:{password}@{MONGO_HOST}:{MONGO_PORT}/{MONGO_CLIENT}?authSource={MONGO_CLIENT}"
+
+
+def client_options():
+    """
+    Build MongoClient keyword arguments from the environment
+    
+    Returns:
+        dict: Pool, timeout, compression and read preference options
+    """
+    options = {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'readPreference': MONGO_READ_PREFERENCE,
+        # Don't block on a handshake here; the first operation connects
+        'connect': False
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options['socketTimeoutMS'] = MONGO_SOCKET_TIMEOUT_MS
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    return options
+
+
+def get_client():
+    """
+    Return the process-wide MongoClient, creating it on first use
+    
+    Creating the client does no I/O. A client inherited across fork() is
+    not safe to use, so a forked worker gets its own client (and pool) the
+    first time it calls this.
+    
+    Returns:
+        pymongo.MongoClient: The shared client
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = MongoClient(mongo_uri(), **client_options())
+            _client_pid = pid
+        return _client
+
+
+def get_db():
+    """Return the application database on the shared client"""
+    return get_client()[MONGO_CLIENT]
+
+
+def use_client(client, database=None):
+    """
+    Make an already created client this process's shared client
+
+    Lets tools such as bench_routes.py run the app against an in-memory
+    stand-in (e.g. mongomock) or a client they configured themselves.
+
+    Args:
+        client: A MongoClient, or an object with the same interface
+        database (str, optional): Database get_db() returns from now on, e.g. a
+            scratch database. Defaults to keeping MONGO_CLIENT.
+    """
+    global _client, _client_pid, MONGO_CLIENT
+    with _client_lock:
+        _client = client
+        _client_pid = os.getpid()
+        if database:
+            MONGO_CLIENT = database
+
+
+def close_client():
+    """Close the shared client (if this process created one); the next get_client() makes a new one"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
 
 # connects to email threads collection and retrieves the chat histories. 
 
 def connect_to_mongodb(collection_name=None):
     """
-    Establish connection to MongoDB
+    Check the connection to MongoDB and return the shared client
     
     Args:
         collection_name (str, optional): Name of the collection to connect to.
@@ -35,12 +142,7 @@ def connect_to_mongodb(collection_name=None):
         tuple: (client, collection) if successful, (None, None) otherwise
     """
     try:
-        username = quote_plus(USER_NAME)
-        password = quote_plus(PASS)
-        
-        uri = f"mongodb://{username}:{password}@{MONGO_HOST}:{MONGO_PORT}/{MONGO_CLIENT}?authSource={MONGO_CLIENT}"
-        
-        client = MongoClient(uri)
+        client = get_client()
         # Test connection
         client.admin.command('ping')
         
@@ -54,15 +156,326 @@ def connect_to_mongodb(collection_name=None):
         return None, None
 
 
-def extract_chat_histories(collection):
+def parse_timestamp(timestamp):
+    """
+    Convert a stored timestamp to a naive UTC datetime
+    
+    Args:
+        timestamp: A datetime, an ISO-8601 string or a {'$date': ...} dict
+        
+    Returns:
+        datetime: The parsed timestamp, or None if it can't be parsed
+    """
+    if isinstance(timestamp, dict) and '$date' in timestamp:
+        timestamp = timestamp['$date']
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(timestamp, datetime):
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def to_date_expr(expr):
+    """Aggregation expression converting a stored timestamp (date or ISO string) to a date, or null"""
+    return {'$convert': {'input': expr, 'to': 'date', 'onError': None, 'onNull': None}}
+
+
+def build_message_entry(user_id, session_id, position, chat_item):
+    """
+    Build a message index entry for a single chat_history item
+    
+    Args:
+        user_id (str): Owner of the session
+        session_id (str): Session containing the item
+        position (int): Index of the item within the session's chat_history
+        chat_item (dict): The chat_history item
+        
+    Returns:
+        dict: Location of the item plus its timestamp and per-role contents
+    """
+    return {
+        'user_id': user_id,
+        'session_id': session_id,
+        'position': position,
+        'timestamp': chat_item.get('timestamp'),
+        'roles': [
+            {
+                'role': msg.get('role'),
+                'content': msg.get('content', ''),
+                'name': msg.get('name', '') if msg.get('role') == 'function' else None
+            }
+            for msg in chat_item.get('messages', [])
+        ]
+    }
+
+
+def message_key(user_id, session_id, position, chat_item):
+    """Return the message_id of a chat_history item, falling back to user_session_position"""
+    return chat_item.get('message_id') or f"{user_id}_{session_id}_{position}"
+
+
+def find_message(collection, message_id):
+    """
+    Look up a single chat_history item by message_id without scanning all sessions
+    
+    Args:
+        collection (pymongo.collection.Collection): The email_threads collection
+        message_id (str): The message_id to find
+        
+    Returns:
+        dict: Message index entry, or None if the message does not exist
+    """
+    doc = collection.find_one(
+        {'sessions.chat_history.message_id': message_id},
+        {'userid': 1, 'sessions': {'$elemMatch': {'chat_history.message_id': message_id}}}
+    )
+    if not doc:
+        return None
+    
+    user_id = str(doc.get('userid', doc.get('_id', 'unknown')))
+    for session in doc.get('sessions', []):
+        session_id = str(session.get('session_id', 'unknown'))
+        for idx, chat_item in enumerate(session.get('chat_history', [])):
+            if isinstance(chat_item, dict) and chat_item.get('message_id') == message_id:
+                return build_message_entry(user_id, session_id, idx, chat_item)
+    return None
+
+
+def find_messages(collection, message_ids):
+    """
+    Look up many chat_history items by message_id with a single aggregation
+    
+    Only the matching items are returned by the server, not their sessions.
+    
+    Args:
+        collection (pymongo.collection.Collection): The email_threads collection
+        message_ids (list): The message_ids to find
+        
+    Returns:
+        dict: message_id -> message index entry, for ids that exist
+    """
+    match = {'sessions.chat_history.message_id': {'$in': list(message_ids)}}
+    pipeline = [
+        {'$match': match},
+        {'$project': {'userid': 1, 'sessions.session_id': 1, 'sessions.chat_history': 1}},
+        {'$unwind': '$sessions'},
+        {'$match': match},
+        {'$unwind': {'path': '$sessions.chat_history', 'includeArrayIndex': 'position'}},
+        {'$match': match}
+    ]
+    
+    entries = {}
+    for doc in collection.aggregate(pipeline):
+        user_id = str(doc.get('userid', doc.get('_id', 'unknown')))
+        session = doc['sessions']
+        chat_item = session['chat_history']
+        entries.setdefault(chat_item['message_id'], build_message_entry(
+            user_id, str(session.get('session_id', 'unknown')), doc['position'], chat_item
+        ))
+    return entries
+
+
+def userid_query(user_id):
+    """Match a userid given as a string against values stored as either strings or integers"""
+    if user_id.isdigit():
+        return {'$in': [user_id, int(user_id)]}
+    return user_id
+
+
+def summarize_user_sessions(collection, user_id):
+    """
+    Summarize one user's sessions with a query scoped to that user
+    
+    Only each session's id, chat_history size and first/last timestamps are
+    returned by the server; message bodies never leave MongoDB.
+    
+    Args:
+        collection (pymongo.collection.Collection): The email_threads collection
+        user_id (str): The user whose sessions to summarize
+        
+    Returns:
+        list: Dicts with 'id', 'messageCount', 'createdAt' and 'lastActivity'
+            (raw timestamps, None when the session has no messages)
+    """
+    chat_history = {'$ifNull': ['$sessions.chat_history', []]}
+    pipeline = [
+        {'$match': {'userid': userid_query(user_id)}},
+        {'$project': {'sessions.session_id': 1, 'sessions.chat_history.timestamp': 1}},
+        {'$unwind': '$sessions'},
+        {'$project': {
+            '_id': 0,
+            'id': '$sessions.session_id',
+            'messageCount': {'$size': chat_history},
+            'createdAt': {'$arrayElemAt': ['$sessions.chat_history.timestamp', 0]},
+            'lastActivity': {'$arrayElemAt': ['$sessions.chat_history.timestamp', -1]}
+        }}
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+def fetch_session(collection, user_id, session_id):
+    """
+    Fetch a single session sub-document with an $elemMatch projection
+    
+    Args:
+        collection (pymongo.collection.Collection): The email_threads collection
+        user_id (str): Owner of the session
+        session_id (str): The session to fetch
+        
+    Returns:
+        dict: Session record (see build_session_record), or None if not found
+    """
+    doc = collection.find_one(
+        {'userid': userid_query(user_id), 'sessions.session_id': session_id},
+        {'_id': 0, 'sessions': {'$elemMatch': {'session_id': session_id}}}
+    )
+    if not doc or not doc.get('sessions'):
+        return None
+    return build_session_record(user_id, session_id, doc['sessions'][0])
+
+
+def list_users(collection, with_stats=False):
+    """
+    List user ids server-side without loading any message bodies
+    
+    Args:
+        collection (pymongo.collection.Collection): The email_threads collection
+        with_stats (bool, optional): Also return per-user session counts and the
+            latest chat_history timestamp. Defaults to False.
+        
+    Returns:
+        list: Dicts with 'id' (and 'sessionCount'/'lastActivity' when with_stats), sorted by id
+    """
+    valid_user = {'userid': {'$exists': True, '$nin': [None, '']}}
+    
+    if not with_stats:
+        # distinct on an indexed field is answered from the index
+        return [{'id': str(user_id)} for user_id in sorted(collection.distinct('userid', valid_user), key=str)]
+    
+    sessions = {'$ifNull': ['$sessions', []]}
+    pipeline = [
+        {'$match': valid_user},
+        {'$project': {
+            'userid': 1,
+            'sessionCount': {'$size': sessions},
+            # Last chat_history timestamp of each session, then the latest of those
+            'lastActivity': {'$max': {'$map': {
+                'input': sessions,
+                'as': 'session',
+                'in': {'$arrayElemAt': ['$$session.chat_history.timestamp', -1]}
+            }}}
+        }},
+        {'$group': {
+            '_id': '$userid',
+            'sessionCount': {'$sum': '$sessionCount'},
+            'lastActivity': {'$max': '$lastActivity'}
+        }},
+        {'$sort': {'_id': 1}}
+    ]
+    return [
+        {'id': str(doc['_id']), 'sessionCount': doc['sessionCount'], 'lastActivity': doc.get('lastActivity')}
+        for doc in collection.aggregate(pipeline)
+    ]
+
+
+def ensure_indexes(db):
+    """
+    Create the indexes the API's targeted lookups rely on (idempotent)
+    
+    Args:
+        db (pymongo.database.Database): The application database
+    """
+    try:
+        db[MONGO_COLLECTION].create_index('userid')
+        db[MONGO_COLLECTION].create_index('sessions.session_id')
+        db[MONGO_COLLECTION].create_index('sessions.chat_history.message_id')
+        db['alfred_feedback'].create_index('message_id')
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+
+
+def build_session_record(user_id, session_id, session, message_index=None):
+    """
+    Normalize one session sub-document into the API's session structure
+    
+    Each chat_history item is annotated in place with its sequence number and
+    a fallback timestamp, and optionally added to a message index.
+    
+    Args:
+        user_id (str): Owner of the session
+        session_id (str): The session's id
+        session (dict): Session sub-document from email_threads
+        message_index (dict, optional): Index to update with the session's messages
+        
+    Returns:
+        dict: Session data with chat_history, projects, tasks and email thread fields
+    """
+    chat_history = session.get('chat_history', [])
+    # Annotate each message with explicit sequence number and ensure timestamp exists
+    for idx, msg in enumerate(chat_history):
+        if isinstance(msg, dict):
+            # Fallback timestamp if missing or empty
+            if not msg.get('timestamp'):
+                msg['timestamp'] = datetime.utcnow().isoformat()
+            # Explicit sequence index
+            msg['sequence'] = idx
+            if message_index is not None:
+                key = message_key(user_id, session_id, idx, msg)
+                message_index[key] = build_message_entry(user_id, session_id, idx, msg)
+    
+    # Store the session data as a dict with all fields
+    return {
+        'chat_history': chat_history,
+        'projects': session.get('projects', []),
+        'tasks': session.get('tasks', []),
+        'email_thread_chain': session.get('email_thread_chain', []),
+        'email_thread_id': session.get('email_thread_id', None)
+    }
+
+
+def iter_chat_sessions(collection, batch_size=100):
+    """
+    Stream sessions straight from a MongoDB cursor, one at a time
+    
+    Unlike extract_chat_histories() nothing is accumulated, so memory stays
+    flat regardless of collection size.
+    
+    Args:
+        collection (pymongo.collection.Collection): MongoDB collection to query
+        batch_size (int, optional): Documents fetched per cursor round trip. Defaults to 100.
+        
+    Yields:
+        dict: Session record (see build_session_record) plus user_id and session_id keys
+    """
+    users = collection.find({}, {'userid': 1, 'sessions': 1}, batch_size=batch_size)
+    for user in users:
+        user_id = str(user.get('userid', user.get('_id', 'unknown')))
+        for session in user.get('sessions', []):
+            session_id = str(session.get('session_id', 'unknown'))
+            record = {'user_id': user_id, 'session_id': session_id}
+            record.update(build_session_record(user_id, session_id, session))
+            yield record
+
+
+def extract_chat_histories(collection, message_index=None):
     """
     Extract all chat histories for all users in a hierarchical JSON format
     
     Args:
         collection (pymongo.collection.Collection): MongoDB collection to query
+        message_index (dict, optional): If given, filled in the same pass with
+            message_id -> entry (see build_message_entry)
         
     Returns:
         dict: Nested dictionary with user_id -> session_id -> chat_history structure
+        
+    Raises:
+        Exception: Whatever the driver raised; a partial extraction is never returned
     """
     if collection is None:
         print("Cannot extract chat histories: collection is None")
@@ -72,7 +485,7 @@ def extract_chat_histories(collection):
     
     try:
         # Find all users
-        users = collection.find({})
+        users = collection.find({}, {'userid': 1, 'sessions': 1})
         user_count = 0
         session_count = 0
         
@@ -87,28 +500,7 @@ def extract_chat_histories(collection):
             sessions = user.get('sessions', [])
             for session in sessions:
                 session_id = str(session.get('session_id', 'unknown'))
-                chat_history = session.get('chat_history', [])
-                # Annotate each message with explicit sequence number and ensure timestamp exists
-                for idx, msg in enumerate(chat_history):
-                    if isinstance(msg, dict):
-                        # Fallback timestamp if missing or empty
-                        if not msg.get('timestamp'):
-                            msg['timestamp'] = datetime.utcnow().isoformat()
-                        # Explicit sequence index
-                        msg['sequence'] = idx
-                projects = session.get('projects', [])
-                tasks = session.get('tasks', [])
-                email_thread_chain = session.get('email_thread_chain', [])
-                email_thread_id = session.get('email_thread_id', None)
-
-                # Store the session data as a dict with all fields
-                all_chats[user_id][session_id] = {
-                    'chat_history': chat_history,
-                    'projects': projects,
-                    'tasks': tasks,
-                    'email_thread_chain': email_thread_chain,
-                    'email_thread_id': email_thread_id
-                }
+                all_chats[user_id][session_id] = build_session_record(user_id, session_id, session, message_index)
                 
                 session_count += 1
             user_count += 1
@@ -116,6 +508,7 @@ def extract_chat_histories(collection):
         print(f"Processed {user_count} users with {session_count} sessions")
     except Exception as e:
         print(f"Error extracting chat histories: {e}")
+        raise
     
     return all_chats
 
@@ -147,6 +540,37 @@ def save_to_json(data, filename=None, output_dir="chat_exports"):
     return filepath
 
 
+def save_to_ndjson(collection, filename=None, output_dir="chat_exports"):
+    """
+    Stream every session from a collection to a newline-delimited JSON file
+    
+    Args:
+        collection (pymongo.collection.Collection): MongoDB collection to export
+        filename (str, optional): Name of the file. If not provided, a timestamp will be used.
+        output_dir (str, optional): Directory to save the file. Defaults to "chat_exports".
+        
+    Returns:
+        str: Path to the saved file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    if not filename:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"chat_histories_{timestamp}.ndjson"
+    
+    filepath = os.path.join(output_dir, filename)
+    
+    session_count = 0
+    with open(filepath, 'w') as f:
+        for record in iter_chat_sessions(collection):
+            f.write(json.dumps(record, default=str))
+            f.write("\n")
+            session_count += 1
+    
+    print(f"Data saved to {filepath} ({session_count} sessions)")
+    return filepath
+
+
 def save_to_csv(data, filename=None, output_dir="chat_exports"):
     """
     Save data to a CSV file
@@ -254,5 +678,7 @@ if __name__ == "__main__":
         if chat_data:
             save_to_json(chat_data, "all_chat_histories.json")
             save_to_csv(chat_data, "all_chat_histories.csv")
+            # Streaming export that doesn't hold the dataset in memory
+            save_to_ndjson(collection, "all_chat_histories.ndjson")
         else:
             print("No chat data was extracted")
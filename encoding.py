@@ -0,0 +1,90 @@
+"""
+Response Encoding
+
+This module encodes API responses as JSON. orjson is used when it is
+installed (several times faster than the standard library, with native
+datetime support); otherwise the standard library encoder is used with
+the same type handling, so responses look the same either way.
+Datetimes become ISO-8601 strings, ObjectIds and other BSON types
+become strings, and sets become lists.
+
+Set JSON_ENCODER to 'orjson' or 'json' to choose explicitly.
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import os
+
+from bson import Decimal128, ObjectId, Timestamp
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 'auto' (orjson when installed), 'orjson' or 'json'
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto').lower()
+
+
+def default(obj):
+    """Convert values JSON has no type for; used by both encoders"""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Timestamp):
+        return obj.as_datetime().isoformat()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (bytes, bytearray)):  # Includes bson Binary
+        return base64.b64encode(obj).decode()
+    return str(obj)
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+ENCODERS = {'json': (_json_dumps, json.loads)}
+if orjson is not None:
+    ENCODERS['orjson'] = (_orjson_dumps, orjson.loads)
+
+if JSON_ENCODER == 'auto':
+    ENCODER = 'orjson' if orjson is not None else 'json'
+elif JSON_ENCODER in ENCODERS:
+    ENCODER = JSON_ENCODER
+else:
+    print(f"JSON encoder '{JSON_ENCODER}' is not available, using the standard library")
+    ENCODER = 'json'
+
+# dumps(obj) returns UTF-8 JSON bytes; loads(bytes or str) parses JSON
+dumps, loads = ENCODERS[ENCODER]
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by this module's encoder
+
+    Installed as app.json, so jsonify() in every route and blueprint uses it.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
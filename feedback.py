@@ -0,0 +1,283 @@
+"""
+Feedback Resolution Service
+
+This module resolves alfred_feedback documents for message ids. Documents
+are keyed either by _id (current writes) or by a message_id field (legacy
+documents); both are looked up with one batched $or query, _id matches take
+precedence, and results are kept in an in-memory map that writes update.
+"""
+
+import copy
+import os
+import threading
+import time
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Seconds resolved feedback is reused before being re-read (picks up writes from other processes)
+FEEDBACK_CACHE_TTL = float(os.environ.get('FEEDBACK_CACHE_TTL', 60))
+
+# Maximum number of ids per $or lookup
+FEEDBACK_BATCH_SIZE = 1000
+
+
+def apply_update(doc, doc_id, ops):
+    """
+    Apply an upsert's update operators to a local copy of a document
+
+    Args:
+        doc (dict): Document before the update, or None if it was inserted
+        doc_id (str): _id of the document
+        ops (dict): Update operators ($set, $setOnInsert, $push, $inc)
+
+    Returns:
+        dict: The document as it is after the update
+    """
+    if doc is None:
+        after = {'_id': doc_id}
+        after.update(ops.get('$setOnInsert', {}))
+    else:
+        after = copy.deepcopy(doc)
+
+    after.update(ops.get('$set', {}))
+    for field, value in ops.get('$push', {}).items():
+        values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+        after[field] = list(after.get(field) or []) + list(values)
+    for field, value in ops.get('$inc', {}).items():
+        after[field] = after.get(field, 0) + value
+    return after
+
+
+class FeedbackResolver:
+    """
+    Batched, cached lookup of feedback documents by message id
+
+    resolve() fetches unknown ids in $or batches and remembers both found
+    documents and misses; write() upserts one document and updates the map
+    in place. The whole map expires after the TTL.
+    """
+
+    def __init__(self, get_collection, ttl=FEEDBACK_CACHE_TTL, batch_size=FEEDBACK_BATCH_SIZE):
+        """
+        Args:
+            get_collection (callable): Returns the alfred_feedback collection; called on
+                every use so a forked worker picks up its own client
+            ttl (float, optional): Map lifetime in seconds. Defaults to FEEDBACK_CACHE_TTL.
+            batch_size (int, optional): Ids per lookup. Defaults to FEEDBACK_BATCH_SIZE.
+        """
+        self.get_collection = get_collection
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self._docs = {}
+        self._rated = {}
+        self._loaded_at = time.time()
+        self._version = 0
+        self._lock = threading.Lock()
+
+        # Counters reported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.writes = 0
+
+    @property
+    def collection(self):
+        """The alfred_feedback collection on the current process's client"""
+        return self.get_collection()
+
+    def _expire_if_stale(self):
+        if time.time() - self._loaded_at >= self.ttl:
+            self.clear()
+
+    def _fetch(self, message_ids):
+        """Look up one batch of ids with a single $or query"""
+        id_set = set(message_ids)
+        self.queries += 1
+        docs = self.collection.find({'$or': [{'_id': {'$in': message_ids}}, {'message_id': {'$in': message_ids}}]})
+
+        found = {}
+        by_message_id = {}
+        for doc in docs:
+            if doc['_id'] in id_set:
+                found[doc['_id']] = doc
+            if doc.get('message_id') in id_set:
+                by_message_id.setdefault(doc['message_id'], doc)
+        # message_id matches only fill in ids without an _id match
+        for message_id, doc in by_message_id.items():
+            found.setdefault(message_id, doc)
+        return found
+
+    def resolve(self, message_ids):
+        """
+        Resolve feedback documents for many message ids
+
+        Args:
+            message_ids (iterable): Message ids; falsy ids are ignored
+
+        Returns:
+            dict: message_id -> feedback document, for ids that have one
+        """
+        self._expire_if_stale()
+        message_ids = [message_id for message_id in dict.fromkeys(message_ids) if message_id]
+
+        missing = [message_id for message_id in message_ids if message_id not in self._docs]
+        self.hits += len(message_ids) - len(missing)
+        self.misses += len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            found = self._fetch(batch)
+            with self._lock:
+                for message_id in batch:
+                    self._docs.setdefault(message_id, found.get(message_id))
+
+        docs = self._docs
+        return {message_id: docs[message_id] for message_id in message_ids if docs.get(message_id) is not None}
+
+    def get(self, message_id):
+        """Return the feedback document for one message id, or None"""
+        return self.resolve([message_id]).get(message_id)
+
+    def message_ids_with_feedback(self, feedback):
+        """
+        Return the ids of every message with the given rating
+
+        Uses the same precedence as resolve(): a legacy document only rates
+        its message_id when no document has that id as its _id.
+
+        Args:
+            feedback (str): Rating value ('good', 'bad' or 'neutral')
+
+        Returns:
+            set: Matching _id and message_id values
+        """
+        self._expire_if_stale()
+        rated = self._rated.get(feedback)
+        if rated is None:
+            self.queries += 1
+            rated = set()
+            legacy = set()
+            for doc in self.collection.find({'feedback': feedback}, {'message_id': 1}):
+                rated.add(doc['_id'])
+                if doc.get('message_id'):
+                    legacy.add(doc['message_id'])
+
+            candidates = list(legacy - rated)
+            shadowed = set()
+            for start in range(0, len(candidates), self.batch_size):
+                batch = candidates[start:start + self.batch_size]
+                self.queries += 1
+                # These messages have an _id document with another rating, which is the one shown
+                shadowed.update(doc['_id'] for doc in self.collection.find({'_id': {'$in': batch}}, {'_id': 1}))
+            rated.update(message_id for message_id in candidates if message_id not in shadowed)
+            self._rated[feedback] = rated
+        return rated
+
+    def write(self, message_id, ops):
+        """
+        Upsert the feedback document for a message and update the map
+
+        Args:
+            message_id (str): Message id, used as the document _id
+            ops (dict): Update operators
+
+        Returns:
+            tuple: (document before the write or None, document after the write)
+        """
+        before = self.collection.find_one_and_update(
+            {'_id': message_id},
+            ops,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        after = apply_update(before, message_id, ops)
+        with self._lock:
+            self._docs[message_id] = after
+            self._rated.clear()
+            self._version += 1
+            self.writes += 1
+        return before, after
+
+    def write_many(self, writes):
+        """
+        Upsert feedback documents for many messages with one unordered bulk_write
+
+        The before- and after-images are read from the collection (one _id
+        lookup each side of the bulk_write), never from the map, so they are
+        exact even when other processes wrote in the meantime.
+
+        Args:
+            writes (list): (message_id, ops) tuples with distinct message ids
+
+        Returns:
+            tuple: (list holding (before, after) per write, or None where it failed;
+                dict of failed write position -> error message)
+        """
+        if not writes:
+            return [], {}
+
+        message_ids = [message_id for message_id, _ in writes]
+        self.queries += 1
+        before_docs = {doc['_id']: doc for doc in self.collection.find({'_id': {'$in': message_ids}})}
+
+        errors = {}
+        try:
+            self.collection.bulk_write(
+                [UpdateOne({'_id': message_id}, ops, upsert=True) for message_id, ops in writes],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            errors = {error['index']: error.get('errmsg', 'Write failed') for error in e.details.get('writeErrors', [])}
+
+        written = [message_id for position, message_id in enumerate(message_ids) if position not in errors]
+        self.queries += 1
+        after_docs = {doc['_id']: doc for doc in self.collection.find({'_id': {'$in': written}})} if written else {}
+
+        results = []
+        with self._lock:
+            for position, message_id in enumerate(message_ids):
+                after = after_docs.get(message_id)
+                if position in errors or after is None:
+                    self._docs.pop(message_id, None)
+                    results.append(None)
+                    continue
+                self._docs[message_id] = after
+                results.append((before_docs.get(message_id), after))
+            self._rated.clear()
+            self._version += 1
+            self.writes += len(writes) - len(errors)
+        return results, errors
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._docs = {}
+            self._rated = {}
+            self._loaded_at = time.time()
+            self._version += 1
+
+    @property
+    def version(self):
+        """Counter bumped whenever cached feedback changes or is dropped (an expired map is dropped first)"""
+        self._expire_if_stale()
+        return self._version
+
+    def stats(self):
+        """
+        Get resolver counters
+
+        Returns:
+            dict: Cached entry count, hit/miss counters, queries and writes
+        """
+        lookups = self.hits + self.misses
+        return {
+            'version': self._version,
+            'ttl': self.ttl,
+            'entries': len(self._docs),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'queries': self.queries,
+            'writes': self.writes
+        }
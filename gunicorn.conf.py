@@ -0,0 +1,68 @@
+"""
+Gunicorn Configuration for the Flask API
+
+Run with `gunicorn -c gunicorn.conf.py wsgi:app`. Every setting can be
+overridden from the environment (see the README's Production Serving
+section).
+"""
+
+import multiprocessing
+import os
+import threading
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+
+# Each worker holds its own chat snapshot, so memory grows with the worker count
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+
+# Threads let a slow dashboard request run beside quick ones in the same worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Snapshot builds on large collections can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app once in the master (fast: no database I/O at import) and fork workers from it
+preload_app = True
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Build the forked worker's own client, indexes and warm snapshot before it accepts requests"""
+    from app import warm_caches
+
+    result = {}
+
+    def warm():
+        try:
+            result['snapshot'] = warm_caches()
+        except Exception as e:
+            result['error'] = e
+
+    # The worker only starts its own heartbeat once this hook returns, so beat for it while
+    # warming; otherwise a warm-up longer than `timeout` gets the worker killed and respawned
+    thread = threading.Thread(target=warm, name='warm-caches', daemon=True)
+    thread.start()
+    while thread.is_alive():
+        worker.notify()
+        thread.join(max(1, timeout / 4))
+
+    if 'error' in result:
+        # The worker still serves; its first requests build the cache instead
+        server.log.error(f"Worker {worker.pid} failed to warm caches: {result['error']}")
+    else:
+        server.log.info(f"Worker {worker.pid} warmed chat snapshot v{result['snapshot'].version}")
+
+
+def worker_exit(server, worker):
+    """Stop the worker's sync thread and close its MongoDB client"""
+    from app import release_resources
+
+    try:
+        release_resources()
+    except Exception as e:
+        server.log.error(f"Worker {worker.pid} failed to release resources: {e}")
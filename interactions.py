@@ -0,0 +1,242 @@
+"""
+Interaction Index and Keyset Pagination
+
+This module flattens a chat snapshot into user→assistant interactions
+ordered by (timestamp, message_id), with per-user and per-function
+partitions, so /api/interactions can serve filtered pages without
+materializing the whole dataset.
+"""
+
+import base64
+import json
+from bisect import bisect_left, bisect_right
+
+# Upper bound for the `limit` query parameter
+MAX_PAGE_SIZE = 1000
+
+
+def normalize_timestamp(timestamp):
+    """Return a chat_history timestamp as a string ({'$date': ...} and datetimes included)"""
+    if isinstance(timestamp, dict) and '$date' in timestamp:
+        timestamp = timestamp['$date']
+    elif hasattr(timestamp, 'isoformat'):  # Python datetime object
+        timestamp = timestamp.isoformat()
+    return str(timestamp)
+
+
+class InteractionPartition:
+    """Interaction rows sorted by (timestamp, message_id) with a parallel key list for bisecting"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: row[0])
+        self.keys = [row[0] for row in self.rows]
+
+
+class InteractionIndex:
+    """
+    Sorted interaction rows for one snapshot
+
+    Each row is a ((timestamp, message_id), user_id, function_name, chat_item)
+    tuple; contents are only read when a row is materialized.
+    """
+
+    def __init__(self, rows):
+        self.all = InteractionPartition(rows)
+        self.by_id = {row[0][1]: row for row in self.all.rows if row[0][1]}
+        # name -> (version, InteractionPartition), see subset()
+        self._subsets = {}
+
+        by_user = {}
+        by_function = {}
+        for row in self.all.rows:
+            by_user.setdefault(row[1], []).append(row)
+            if row[2]:
+                by_function.setdefault(row[2], []).append(row)
+        self.by_user = {key: InteractionPartition(rows) for key, rows in by_user.items()}
+        self.by_function = {key: InteractionPartition(rows) for key, rows in by_function.items()}
+
+    def subset(self, name, version, message_ids):
+        """
+        Return the partition of rows whose message_id is in a set, memoized per name and version
+
+        Only the latest version is kept for each name, so e.g. the partition
+        for one rating is reused until the feedback it came from changes.
+
+        Args:
+            name (hashable): What the ids select, e.g. a rating value
+            version (int): Version of the ids' source, read before computing them
+            message_ids (callable): Returns the set of message_ids; only called on a miss
+
+        Returns:
+            InteractionPartition: The matching rows
+        """
+        cached = self._subsets.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        partition = InteractionPartition([self.by_id[mid] for mid in message_ids() if mid in self.by_id])
+        self._subsets[name] = (version, partition)
+        return partition
+
+
+def build_interaction_index(snapshot):
+    """
+    Flatten a chat snapshot into an InteractionIndex
+
+    Args:
+        snapshot (cache.ChatSnapshot): Snapshot to index
+
+    Returns:
+        InteractionIndex: Sorted rows for every item with both user and assistant content
+    """
+    rows = []
+    for user_id, sessions in snapshot.data.items():
+        for session_id, session_data in sessions.items():
+            chat_history = session_data.get('chat_history')
+            if not chat_history or not isinstance(chat_history, list):
+                continue
+
+            for message in chat_history:
+                # Validate message structure
+                if not isinstance(message, dict) or 'messages' not in message:
+                    continue
+
+                has_user = has_assistant = False
+                function_name = None
+                for msg in message.get('messages', []):
+                    role = msg.get('role')
+                    if role == 'user' and msg.get('content'):
+                        has_user = True
+                    elif role == 'assistant' and msg.get('content'):
+                        has_assistant = True
+                    elif role == 'function':
+                        function_name = msg.get('name')
+
+                # Only index items that have both user and assistant content
+                if has_user and has_assistant:
+                    key = (normalize_timestamp(message.get('timestamp')), message.get('message_id') or '')
+                    rows.append((key, user_id, function_name, message))
+
+    print(f"Indexed {len(rows)} interactions for snapshot v{snapshot.version}")
+    return InteractionIndex(rows)
+
+
+def materialize_interaction(row):
+    """
+    Build the API representation of an interaction row
+
+    Args:
+        row (tuple): Row from an InteractionIndex
+
+    Returns:
+        dict: Interaction with default (empty) feedback fields
+    """
+    (timestamp, message_id), user_id, _, message = row
+
+    # Find user and assistant messages
+    user_content = None
+    assistant_content = None
+    function_name = None
+    function_response = None
+
+    for msg in message.get('messages', []):
+        if msg.get('role') == 'user':
+            user_content = msg.get('content')
+        elif msg.get('role') == 'assistant':
+            assistant_content = msg.get('content')
+        elif msg.get('role') == 'function':
+            function_name = msg.get('name')
+            function_response = msg.get('content')
+
+    return {
+        'id': message.get('message_id'),  # Keep using 'id' for frontend compatibility
+        'userPrompt': user_content,
+        'aiResponse': assistant_content,
+        'timestamp': timestamp,
+        'agents': [],
+        'function_name': function_name,
+        'function_response': function_response,
+        'rating': None,
+        'comments': [],
+        'user': {
+            'name': user_id,
+            'avatar': ''
+        }
+    }
+
+
+def encode_cursor(key):
+    """Encode a (timestamp, message_id) key as an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (str(timestamp), str(message_id))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def select_interactions(index, after=None, limit=None, user=None, function_name=None,
+                        start=None, end=None, partition=None):
+    """
+    Select interaction rows in (timestamp, message_id) order
+
+    Filters are applied on the index before any row is materialized. The
+    narrowest available partition (the given one, user, function) is scanned,
+    starting at the cursor or start date, so cost follows the page size
+    rather than the dataset size.
+
+    Args:
+        index (InteractionIndex): Index to read
+        after (tuple, optional): Exclusive (timestamp, message_id) cursor key
+        limit (int, optional): Maximum number of rows. Defaults to no limit.
+        user (str, optional): Only rows for this user_id
+        function_name (str, optional): Only rows whose function role has this name
+        start (str, optional): Inclusive lower bound, an ISO-8601 timestamp or prefix
+        end (str, optional): Inclusive upper bound, an ISO-8601 timestamp or prefix (e.g. a date)
+        partition (InteractionPartition, optional): Only rows of this partition of the
+            index, e.g. one from InteractionIndex.subset()
+
+    Returns:
+        tuple: (rows, next_cursor_key) where next_cursor_key is None on the last page
+    """
+    if partition is None:
+        if user is not None:
+            partition = index.by_user.get(user)
+        elif function_name is not None:
+            partition = index.by_function.get(function_name)
+        else:
+            partition = index.all
+
+    if partition is None:
+        return [], None
+
+    position = 0
+    if after is not None:
+        position = bisect_right(partition.keys, after)
+    if start:
+        position = max(position, bisect_left(partition.keys, (start,)))
+
+    rows = []
+    candidates = partition.rows
+    for i in range(position, len(candidates)):
+        row = candidates[i]
+        if end and row[0][0][:len(end)] > end:
+            break
+        if user is not None and row[1] != user:
+            continue
+        if function_name is not None and row[2] != function_name:
+            continue
+        if limit is not None and len(rows) == limit:
+            # More rows remain, so hand back a cursor to the last returned row
+            return rows, rows[-1][0]
+        rows.append(row)
+
+    return rows, None
@@ -0,0 +1,106 @@
+"""
+Concurrent Load Test for the API
+
+Hits a set of routes from many client threads for a fixed duration and
+reports throughput and latency percentiles. Run it against the server with
+different GUNICORN_WORKERS values to measure how throughput scales:
+
+    GUNICORN_WORKERS=1 gunicorn -c gunicorn.conf.py wsgi:app
+    python loadtest.py --url http://localhost:5001 --concurrency 16 --duration 30
+
+Only the standard library is used, so it runs anywhere the API is reachable.
+"""
+
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Routes a dashboard user loads; override with --path
+DEFAULT_PATHS = [
+    '/api/dashboard',
+    '/api/users',
+    '/api/interactions?limit=50',
+    '/api/stats',
+]
+
+
+def percentile(values, fraction):
+    """Return the value at a fraction (0-1) of the sorted values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_load(base_url, paths, concurrency, duration, timeout=60):
+    """
+    Request the paths round-robin from `concurrency` threads for `duration` seconds
+
+    Args:
+        base_url (str): Server root, e.g. http://localhost:5001
+        paths (list): Request paths
+        concurrency (int): Number of client threads
+        duration (float): Seconds to run
+        timeout (float, optional): Per-request timeout in seconds. Defaults to 60.
+
+    Returns:
+        dict: path -> {'latencies': [...], 'errors': int}
+    """
+    results = {path: {'latencies': [], 'errors': 0} for path in paths}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client(offset):
+        i = offset
+        while time.time() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    results[path]['latencies'].append(elapsed)
+                else:
+                    results[path]['errors'] += 1
+
+    threads = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def print_report(results, duration):
+    """Print per-route and overall requests/second and latency percentiles (ms)"""
+    print(f"{'path':<40} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    all_latencies = []
+    total_errors = 0
+    for path, result in results.items():
+        latencies = result['latencies']
+        all_latencies.extend(latencies)
+        total_errors += result['errors']
+        print(f"{path:<40} {len(latencies) / duration:>8.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} {result['errors']:>7}")
+    print(f"{'TOTAL':<40} {len(all_latencies) / duration:>8.1f} {percentile(all_latencies, 0.5) * 1000:>8.1f} "
+          f"{percentile(all_latencies, 0.95) * 1000:>8.1f} {percentile(all_latencies, 0.99) * 1000:>8.1f} {total_errors:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure API throughput under concurrent load')
+    parser.add_argument('--url', default='http://localhost:5001', help='Server root URL')
+    parser.add_argument('--path', action='append', help='Route to request (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    args = parser.parse_args()
+
+    print(f"Loading {args.url} with {args.concurrency} clients for {args.duration:.0f}s")
+    print_report(run_load(args.url, args.path or DEFAULT_PATHS, args.concurrency, args.duration), args.duration)
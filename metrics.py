@@ -0,0 +1,295 @@
+"""
+Request and MongoDB Metrics
+
+This module records per-route request latency and MongoDB usage and
+renders them in the Prometheus text exposition format (served by
+GET /api/_metrics). A pymongo CommandListener times every command and
+counts the documents and reply bytes it returns, attributed to the route
+whose thread issued it (commands from background threads such as the
+chat sync are labelled "background"). Flask hooks time each request and
+count its Mongo round trips. Cache hit rates are read from the caches'
+stats() when the endpoint is scraped.
+
+A request is recorded when its response is closed, so streamed bodies
+(and the Mongo commands their generators issue) are included.
+
+Metrics are kept per process: under gunicorn each worker reports its own.
+Reply sizes are only measured with METRICS_REPLY_BYTES=1, since that
+re-encodes every reply to BSON.
+"""
+
+import os
+import threading
+import time
+
+import bson
+from flask import request
+from pymongo import monitoring
+
+# Measure the BSON size of every reply ('1') or not ('0'); costs a bson.encode per reply
+METRICS_REPLY_BYTES = os.environ.get('METRICS_REPLY_BYTES', '0') == '1'
+
+# Histogram upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Route and round-trip count of the request the current thread is serving
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with one value per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        """Yield (sample name, labels, value) in label order"""
+        for label_values, value in sorted(self._values.items()):
+            yield self.name, list(zip(self.label_names, label_values)), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down, one per label set"""
+
+    kind = 'gauge'
+
+    def set(self, label_values, value):
+        self._values[label_values] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['counts'][i] += 1
+                break
+        series['sum'] += value
+        series['count'] += 1
+
+    def samples(self):
+        """Yield (sample name, labels, value) for the buckets, sum and count of every series"""
+        for label_values, series in sorted(self._series.items()):
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield f'{self.name}_sum', labels, series['sum']
+            yield f'{self.name}_count', labels, series['count']
+
+
+class Metrics:
+    """
+    Thread-safe registry of the request, MongoDB and cache metrics
+
+    Routes are labelled by their URL rule (e.g. /api/users/<user_id>/sessions),
+    so the number of series stays bounded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches = {}
+        self.requests = Counter('http_requests_total', 'HTTP requests', ('route', 'method', 'status'))
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Time to build and send each response', ('route', 'method'), LATENCY_BUCKETS
+        )
+        self.request_round_trips = Histogram(
+            'http_request_mongo_round_trips', 'MongoDB commands issued while building and streaming each response',
+            ('route',), ROUND_TRIP_BUCKETS
+        )
+        self.commands = Counter('mongo_commands_total', 'MongoDB commands', ('route', 'command', 'outcome'))
+        self.command_seconds = Histogram(
+            'mongo_command_duration_seconds', 'MongoDB command round-trip time', ('command',), LATENCY_BUCKETS
+        )
+        self.documents = Counter('mongo_documents_returned_total', 'Documents returned by MongoDB', ('route', 'command'))
+        self.reply_bytes = Counter('mongo_reply_bytes_total', 'BSON bytes of MongoDB replies decoded', ('route', 'command'))
+
+    def register_cache(self, name, stats):
+        """
+        Report a cache's hit and miss counters on every scrape
+
+        Args:
+            name (str): Value of the 'cache' label
+            stats (callable): Returns a dict with 'hits' and 'misses', and optionally
+                'routes' -> {name: {'hits', 'misses'}} for per-route counters
+        """
+        self._caches[name] = stats
+
+    def observe_request(self, route, method, status, seconds, round_trips):
+        """Record one finished request"""
+        with self._lock:
+            self.requests.inc((route, method, str(status)))
+            self.request_seconds.observe((route, method), seconds)
+            self.request_round_trips.observe((route,), round_trips)
+
+    def observe_command(self, route, command, seconds, outcome, documents=0, reply_bytes=0):
+        """Record one MongoDB command"""
+        with self._lock:
+            self.commands.inc((route, command, outcome))
+            self.command_seconds.observe((command,), seconds)
+            if documents:
+                self.documents.inc((route, command), documents)
+            if reply_bytes:
+                self.reply_bytes.inc((route, command), reply_bytes)
+
+    def _cache_metrics(self):
+        hits = Counter('cache_hits_total', 'Cache hits', ('cache',))
+        misses = Counter('cache_misses_total', 'Cache misses', ('cache',))
+        ratio = Gauge('cache_hit_ratio', 'Hits over lookups since the process started', ('cache',))
+        route_hits = Counter('cache_route_hits_total', 'Cache hits per route', ('cache', 'route'))
+        route_misses = Counter('cache_route_misses_total', 'Cache misses per route', ('cache', 'route'))
+        for name, stats in self._caches.items():
+            counters = stats()
+            lookups = counters['hits'] + counters['misses']
+            hits.inc((name,), counters['hits'])
+            misses.inc((name,), counters['misses'])
+            ratio.set((name,), counters['hits'] / lookups if lookups else 0.0)
+            for route, route_counters in counters.get('routes', {}).items():
+                route_hits.inc((name, route), route_counters['hits'])
+                route_misses.inc((name, route), route_counters['misses'])
+        return [hits, misses, ratio, route_hits, route_misses]
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format
+
+        Returns:
+            str: The exposition text
+        """
+        lines = []
+        with self._lock:
+            metrics = [self.requests, self.request_seconds, self.request_round_trips,
+                       self.commands, self.command_seconds, self.documents, self.reply_bytes]
+            for metric in metrics:
+                self._render_metric(metric, lines)
+        for metric in self._cache_metrics():
+            self._render_metric(metric, lines)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_metric(metric, lines):
+        lines.append(f'# HELP {metric.name} {metric.help_text}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+
+def _documents_in_reply(reply):
+    """Count the documents a command reply carries"""
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if 'values' in reply:  # distinct
+        return len(reply['values'])
+    if 'value' in reply:  # findAndModify
+        return 1 if reply['value'] is not None else 0
+    return 0
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """pymongo listener feeding every command into a Metrics registry"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        if getattr(_local, 'route', None) is not None:
+            _local.round_trips += 1
+
+    def succeeded(self, event):
+        reply = event.reply
+        reply_bytes = len(bson.encode(reply)) if METRICS_REPLY_BYTES else 0
+        self.metrics.observe_command(
+            getattr(_local, 'route', None) or 'background', event.command_name, event.duration_micros / 1e6,
+            'success', _documents_in_reply(reply), reply_bytes
+        )
+
+    def failed(self, event):
+        self.metrics.observe_command(
+            getattr(_local, 'route', None) or 'background', event.command_name, event.duration_micros / 1e6, 'failure'
+        )
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_app(app, metrics):
+    """
+    Time every request of a Flask app and attribute MongoDB commands to its routes
+
+    Call this right after creating the app and before any MongoClient is
+    created: the command listener is registered globally, and only clients
+    created afterwards report to it. The hooks it adds run before, and
+    after, every other hook the app registers later.
+
+    Args:
+        app (flask.Flask): The application
+        metrics (Metrics): Registry to record into
+    """
+    monitoring.register(CommandMetricsListener(metrics))
+
+    @app.before_request
+    def _start_request_metrics():
+        _local.route = _route_label()
+        _local.round_trips = 0
+        _local.started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = getattr(_local, 'started', None)
+        if started is None:
+            return response
+        _local.started = None
+        route, method, status = _local.route, request.method, response.status_code
+
+        def finish():
+            # Runs once the body has been sent, after any streaming generator finished
+            metrics.observe_request(route, method, status, time.perf_counter() - started, _local.round_trips)
+            _local.route = None
+            _local.round_trips = 0
+
+        response.call_on_close(finish)
+        return response
@@ -0,0 +1,245 @@
+"""
+Daily Analytics Rollups
+
+This module maintains the analytics_daily collection: one document per UTC
+day holding that day's interaction, active-user, feedback, rating and
+comment counts, plus a 'totals' document with all-time counters. Analytics
+routes read only the days they need, POST /api/comments applies deltas on
+write, and rebuild_rollups() backfills everything from the raw collections.
+
+Only feedback is kept current on write; interaction and active-user counts
+change when the rollups are rebuilt. Rollups older than ROLLUP_MAX_AGE are
+therefore ignored and the routes aggregate live until the next rebuild.
+Run `python rollups.py --every 900` (or `python rollups.py` from cron) to
+rebuild on a schedule.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from db import connect_to_mongodb, parse_timestamp, to_date_expr, MONGO_CLIENT, MONGO_COLLECTION
+
+ROLLUP_COLLECTION = 'analytics_daily'
+
+# Seconds after a rebuild that the rollups are still read (0 reads them however old they are)
+ROLLUP_MAX_AGE = float(os.environ.get('ROLLUP_MAX_AGE', 3600))
+
+# _id of the all-time counters document; its presence marks the rollups as built
+TOTALS_ID = 'totals'
+
+# Rating values tracked per day; 'none' counts feedback documents without a rating
+RATING_KEYS = ('good', 'bad', 'neutral', 'none')
+
+
+def day_key(date):
+    """Return the rollup _id ('YYYY-MM-DD') for a datetime"""
+    return date.strftime('%Y-%m-%d')
+
+
+def _rating_key(feedback):
+    return feedback if feedback in ('good', 'bad', 'neutral') else 'none'
+
+
+def feedback_contribution(doc):
+    """
+    Counters a single feedback document adds to its day
+
+    Args:
+        doc (dict): alfred_feedback document, or None
+
+    Returns:
+        tuple: (day _id or None when the document has no usable timestamp, counters dict)
+    """
+    if not doc:
+        return None, {}
+
+    timestamp = parse_timestamp(doc.get('timestamp'))
+    comment_count = len(doc.get('comments') or [])
+    rating = _rating_key(doc.get('feedback'))
+    counters = {
+        'feedback_docs': 1,
+        'comments': comment_count,
+        'commented': 1 if comment_count else 0,
+        f'ratings.{rating}': 1,
+        'responses': 1 if comment_count or rating != 'none' else 0
+    }
+    return (day_key(timestamp) if timestamp else None), counters
+
+
+def apply_feedback_changes(db, changes):
+    """
+    Apply the combined rollup delta of many feedback writes
+
+    Does nothing until the rollups have been built, so a partial collection
+    is never mistaken for a complete one. Costs at most two round trips
+    however many writes are applied.
+
+    Args:
+        db (pymongo.database.Database): The application database
+        changes (list): (before, after) document pairs, before being None for inserts
+    """
+    deltas = {}
+    for before, after in changes:
+        for doc, sign in ((before, -1), (after, 1)):
+            day, counters = feedback_contribution(doc)
+            for field, value in counters.items():
+                for key in (day, TOTALS_ID):
+                    if key is not None and value:
+                        day_delta = deltas.setdefault(key, {})
+                        day_delta[field] = day_delta.get(field, 0) + sign * value
+
+    deltas = {key: {field: value for field, value in inc.items() if value} for key, inc in deltas.items()}
+    totals_inc = deltas.pop(TOTALS_ID, {})
+    day_deltas = {key: inc for key, inc in deltas.items() if inc}
+    collection = db[ROLLUP_COLLECTION]
+
+    if totals_inc:
+        ready = collection.update_one({'_id': TOTALS_ID}, {'$inc': totals_inc}).matched_count > 0
+    elif day_deltas:
+        ready = collection.find_one({'_id': TOTALS_ID}, {'_id': 1}) is not None
+    else:
+        return
+    if not ready or not day_deltas:
+        return
+
+    collection.bulk_write([
+        UpdateOne(
+            {'_id': key},
+            {'$inc': inc, '$setOnInsert': {'date': datetime.strptime(key, '%Y-%m-%d')}},
+            upsert=True
+        )
+        for key, inc in day_deltas.items()
+    ], ordered=False)
+
+
+def read_rollups(db, first_day, last_day):
+    """
+    Read the totals document and the day documents in a date range in one query
+
+    Args:
+        db (pymongo.database.Database): The application database
+        first_day (datetime): First day to read (inclusive)
+        last_day (datetime): Last day to read (inclusive)
+
+    Returns:
+        tuple: (totals document, {day _id: day document}), or (None, {}) if the rollups
+            aren't built or are older than ROLLUP_MAX_AGE
+    """
+    docs = db[ROLLUP_COLLECTION].find({'$or': [
+        {'_id': TOTALS_ID},
+        {'_id': {'$gte': day_key(first_day), '$lte': day_key(last_day)}}
+    ]})
+    totals = None
+    days = {}
+    for doc in docs:
+        if doc['_id'] == TOTALS_ID:
+            totals = doc
+        else:
+            days[doc['_id']] = doc
+    if not totals:
+        return None, {}
+    if ROLLUP_MAX_AGE and (datetime.utcnow() - totals['built_at']).total_seconds() > ROLLUP_MAX_AGE:
+        return None, {}
+    return totals, days
+
+
+def _empty_counters():
+    counters = {'interactions': 0, 'users': [], 'feedback_docs': 0, 'comments': 0, 'commented': 0, 'responses': 0}
+    counters['ratings'] = {key: 0 for key in RATING_KEYS}
+    return counters
+
+
+def rebuild_rollups(db):
+    """
+    Recompute every rollup document from email_threads and alfred_feedback
+
+    The documents are written to a scratch collection that then replaces
+    analytics_daily in one rename, so readers never see a partial set.
+    Feedback is aggregated last: only deltas applied between that read and
+    the rename are lost, and the next rebuild restores them.
+
+    Args:
+        db (pymongo.database.Database): The application database
+
+    Returns:
+        int: Number of day documents written
+    """
+    started = datetime.utcnow()
+    rollups = {}
+
+    def day_doc(day):
+        if day not in rollups:
+            rollups[day] = _empty_counters()
+        return rollups[day]
+
+    # Interactions and active users per day (documents without a usable timestamp only count in totals)
+    day_expr = {'$dateToString': {'format': '%Y-%m-%d', 'date': to_date_expr('$sessions.chat_history.timestamp')}}
+    for row in db[MONGO_COLLECTION].aggregate([
+        {'$project': {'userid': 1, 'sessions.chat_history.timestamp': 1}},
+        {'$unwind': '$sessions'},
+        {'$unwind': '$sessions.chat_history'},
+        {'$group': {'_id': {'$ifNull': [day_expr, TOTALS_ID]}, 'interactions': {'$sum': 1}, 'users': {'$addToSet': '$userid'}}}
+    ], allowDiskUse=True):
+        for key in {row['_id'], TOTALS_ID}:
+            doc = day_doc(key)
+            doc['interactions'] += row['interactions']
+            doc['users'] = sorted(set(doc['users']) | {user for user in row['users'] if user not in (None, '')}, key=str)
+
+    # Feedback, comments and ratings per day
+    comment_count = {'$size': {'$ifNull': ['$comments', []]}}
+    rating = {'$cond': [{'$in': ['$feedback', ['good', 'bad', 'neutral']]}, '$feedback', 'none']}
+    day_expr = {'$dateToString': {'format': '%Y-%m-%d', 'date': to_date_expr('$timestamp')}}
+    for row in db.alfred_feedback.aggregate([
+        {'$project': {'day': {'$ifNull': [day_expr, TOTALS_ID]}, 'rating': rating, 'comment_count': comment_count}},
+        {'$group': {
+            '_id': {'day': '$day', 'rating': '$rating'},
+            'feedback_docs': {'$sum': 1},
+            'comments': {'$sum': '$comment_count'},
+            'commented': {'$sum': {'$cond': [{'$gt': ['$comment_count', 0]}, 1, 0]}},
+            'responses': {'$sum': {'$cond': [{'$or': [{'$gt': ['$comment_count', 0]}, {'$ne': ['$rating', 'none']}]}, 1, 0]}}
+        }}
+    ], allowDiskUse=True):
+        for key in {row['_id']['day'], TOTALS_ID}:
+            doc = day_doc(key)
+            for field in ('feedback_docs', 'comments', 'commented', 'responses'):
+                doc[field] += row[field]
+            doc['ratings'][row['_id']['rating']] += row['feedback_docs']
+
+    totals = rollups.pop(TOTALS_ID, _empty_counters())
+    # Per-day user lists are kept for window counts; all-time totals only need the count
+    totals['active_users'] = len(totals.pop('users'))
+    totals.update({'_id': TOTALS_ID, 'built_at': started})
+    day_docs = []
+    for key, doc in sorted(rollups.items()):
+        doc.update({'_id': key, 'date': datetime.strptime(key, '%Y-%m-%d')})
+        day_docs.append(doc)
+
+    scratch = db[f"{ROLLUP_COLLECTION}_rebuild_{os.getpid()}"]
+    scratch.drop()
+    scratch.insert_many(day_docs + [totals])
+    scratch.rename(ROLLUP_COLLECTION, dropTarget=True)
+
+    print(f"Rebuilt {len(day_docs)} daily rollups in {(datetime.utcnow() - started).total_seconds():.2f}s")
+    return len(day_docs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rebuild the daily analytics rollups')
+    parser.add_argument('--every', type=float, default=0,
+                        help='Keep running and rebuild every this many seconds (keep it below ROLLUP_MAX_AGE)')
+    args = parser.parse_args()
+
+    client, _ = connect_to_mongodb()
+    if client is not None:
+        while True:
+            try:
+                rebuild_rollups(client[MONGO_CLIENT])
+            except Exception as e:
+                print(f"Error rebuilding rollups: {e}")
+            if not args.every:
+                break
+            time.sleep(args.every)
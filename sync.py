@@ -0,0 +1,356 @@
+"""
+Incremental Chat Snapshot Sync
+
+This module keeps the chat snapshot cache current without re-reading the
+whole email_threads collection. Changes are taken from a MongoDB change
+stream when the server supports one (replica sets), otherwise by polling
+for documents with a newer updated marker or _id. Only the sessions of the
+users owning changed documents are re-read and patched into the snapshot.
+
+Run `python sync.py` to watch the configured database and print sync stats.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from db import build_session_record, message_key, connect_to_mongodb, MONGO_CLIENT, MONGO_COLLECTION
+
+# Sync mode: 'off', 'auto' (change stream, falling back to polling), 'watch' or 'poll'
+CHAT_SYNC = os.environ.get('CHAT_SYNC', 'off').lower()
+
+# Seconds between polls (and the change stream's maximum wait per read)
+CHAT_SYNC_INTERVAL = float(os.environ.get('CHAT_SYNC_INTERVAL', 5))
+
+# Field writers set to the modification time; used to poll for updated documents
+CHAT_SYNC_UPDATED_FIELD = os.environ.get('CHAT_SYNC_UPDATED_FIELD', 'updated_at')
+
+
+def _user_key(doc):
+    """Return the snapshot user_id for an email_threads document (as extract_chat_histories does)"""
+    return str(doc.get('userid', doc.get('_id', 'unknown')))
+
+
+class ChatSync:
+    """
+    Applies email_threads changes to a ChatSnapshotCache one user at a time
+
+    The sync tracks which documents belong to which user. For every batch
+    of changes it re-reads only the affected users' documents and publishes
+    a patched snapshot; the previous snapshot is left untouched for readers
+    still holding it.
+    """
+
+    def __init__(self, collection, cache, mode=CHAT_SYNC, interval=CHAT_SYNC_INTERVAL,
+                 updated_field=CHAT_SYNC_UPDATED_FIELD):
+        """
+        Args:
+            collection (pymongo.collection.Collection): The email_threads collection
+            cache (cache.ChatSnapshotCache): Cache to patch
+            mode (str, optional): 'auto', 'watch' or 'poll'. Defaults to CHAT_SYNC.
+            interval (float, optional): Poll interval in seconds. Defaults to CHAT_SYNC_INTERVAL.
+            updated_field (str, optional): Modification time field. Defaults to CHAT_SYNC_UPDATED_FIELD.
+        """
+        self.collection = collection
+        self.cache = cache
+        self.mode = mode
+        self.interval = interval
+        self.updated_field = updated_field
+
+        self._doc_users = {}
+        self._user_docs = {}
+        self._last_id = None
+        self._last_marker = None
+        self._marker_ids = set()
+        self._resume_token = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        # Counters reported by stats()
+        self.active_mode = None
+        self.polls = 0
+        self.changes = 0
+        self.patches = 0
+        self.users_patched = 0
+        self.errors = 0
+        self.last_lag_seconds = None
+        self.max_lag_seconds = 0.0
+        self.last_sync_at = None
+
+    def _track(self, doc_id, user_id):
+        """Record that a document belongs to a user; returns the user it belonged to before"""
+        previous = self._doc_users.get(doc_id)
+        if previous is not None and previous != user_id:
+            self._user_docs.get(previous, set()).discard(doc_id)
+        if user_id is None:
+            self._doc_users.pop(doc_id, None)
+        else:
+            self._doc_users[doc_id] = user_id
+            self._user_docs.setdefault(user_id, set()).add(doc_id)
+        return previous
+
+    def prime(self):
+        """
+        Load the document -> user map and the poll markers
+
+        Only _id, userid and the updated marker are read, never sessions.
+        """
+        self._doc_users = {}
+        self._user_docs = {}
+        for doc in self.collection.find({}, {'userid': 1}):
+            self._track(doc['_id'], _user_key(doc))
+
+        object_ids = [doc_id for doc_id in self._doc_users if isinstance(doc_id, ObjectId)]
+        self._last_id = max(object_ids) if object_ids else None
+
+        latest = self.collection.find_one(
+            {self.updated_field: {'$exists': True}},
+            {self.updated_field: 1},
+            sort=[(self.updated_field, -1)]
+        )
+        self._last_marker = latest.get(self.updated_field) if latest else None
+        self._marker_ids = {latest['_id']} if latest else set()
+
+    def _load_users(self, user_ids):
+        """Read the current sessions of the given users' documents"""
+        doc_ids = [doc_id for user_id in user_ids for doc_id in self._user_docs.get(user_id, ())]
+        users = {user_id: [] for user_id in user_ids}
+        if doc_ids:
+            for doc in self.collection.find({'_id': {'$in': doc_ids}}, {'userid': 1, 'sessions': 1}):
+                users.setdefault(_user_key(doc), []).append(doc)
+        return users
+
+    def _patch(self, user_ids, changed_at=None):
+        """
+        Re-read the given users and publish a patched snapshot
+
+        Args:
+            user_ids (set): Users to refresh
+            changed_at (datetime, optional): Time of the oldest change, for lag reporting
+        """
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if not user_ids:
+            return
+        user_docs = self._load_users(user_ids)
+
+        def patcher(snapshot):
+            data = dict(snapshot.data)
+            # The message index is shared with the previous snapshot, which is superseded once this one is published
+            message_index = snapshot.message_index
+            for user_id, docs in user_docs.items():
+                # Drop the user's old entries before indexing the re-read sessions
+                for session_id, session_data in data.get(user_id, {}).items():
+                    for idx, chat_item in enumerate(session_data.get('chat_history') or []):
+                        if isinstance(chat_item, dict):
+                            message_index.pop(message_key(user_id, session_id, idx, chat_item), None)
+
+                if not docs:
+                    data.pop(user_id, None)
+                    continue
+                sessions = data[user_id] = {}
+                for doc in docs:
+                    for session in doc.get('sessions', []):
+                        session_id = str(session.get('session_id', 'unknown'))
+                        sessions[session_id] = build_session_record(user_id, session_id, session, message_index)
+            return data, message_index
+
+        snapshot = self.cache.patch(patcher, user_ids)
+        self.patches += 1
+        self.users_patched += len(user_ids)
+        if changed_at is not None:
+            lag = max(0.0, (datetime.utcnow() - changed_at).total_seconds())
+            self.last_lag_seconds = lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+        if snapshot is not None:
+            print(f"Patched chat snapshot v{snapshot.version} for {len(user_ids)} users")
+
+    def poll_once(self):
+        """
+        Poll for documents inserted, updated or deleted since the last poll and patch their users
+
+        Returns:
+            int: Number of changed documents found
+        """
+        affected = set()
+        oldest = None
+        changed = 0
+
+        # Updated documents, by modification marker; until one has the marker, any document that has it
+        if self._last_marker is not None:
+            query = {self.updated_field: {'$gte': self._last_marker}}
+        else:
+            query = {self.updated_field: {'$exists': True, '$ne': None}}
+        docs = list(self.collection.find(query, {'userid': 1, self.updated_field: 1}))
+        newest = max((doc[self.updated_field] for doc in docs), default=self._last_marker)
+        for doc in docs:
+            marker = doc[self.updated_field]
+            if marker == self._last_marker and doc['_id'] in self._marker_ids:
+                continue  # Already applied at the previous poll
+            changed += 1
+            if isinstance(marker, datetime):
+                oldest = marker if oldest is None else min(oldest, marker)
+            affected.add(_user_key(doc))
+            previous = self._track(doc['_id'], _user_key(doc))
+            if previous is not None:
+                affected.add(previous)
+        if newest != self._last_marker:
+            self._marker_ids = set()
+        self._last_marker = newest
+        self._marker_ids |= {doc['_id'] for doc in docs if doc[self.updated_field] == newest}
+
+        # Inserted documents, by ObjectId order
+        query = {'_id': {'$gt': self._last_id}} if self._last_id is not None else {'_id': {'$type': 'objectId'}}
+        for doc in self.collection.find(query, {'userid': 1}):
+            if doc['_id'] not in self._doc_users:
+                changed += 1
+                affected.add(_user_key(doc))
+                self._track(doc['_id'], _user_key(doc))
+                created = doc['_id'].generation_time.replace(tzinfo=None)
+                oldest = created if oldest is None else min(oldest, created)
+            self._last_id = doc['_id'] if self._last_id is None else max(self._last_id, doc['_id'])
+
+        # Deleted documents; the id scan only runs when the count shows something is missing
+        if self.collection.estimated_document_count() < len(self._doc_users):
+            present = {doc['_id'] for doc in self.collection.find({}, {'_id': 1})}
+            for doc_id in [doc_id for doc_id in self._doc_users if doc_id not in present]:
+                changed += 1
+                affected.add(self._track(doc_id, None))
+
+        self.active_mode = self.active_mode or 'poll'
+        self.polls += 1
+        self.changes += changed
+        self._patch(affected, oldest)
+        if self._last_marker is not None:
+            # Updates can't be missed, so the patched snapshot is as current as a full rebuild
+            self.cache.touch()
+        self.last_sync_at = datetime.utcnow()
+        return changed
+
+    def apply_change(self, event):
+        """
+        Apply one change stream event
+
+        Args:
+            event (dict): Change event opened with full_document='updateLookup'
+        """
+        operation = event.get('operationType')
+        if operation not in ('insert', 'update', 'replace', 'delete'):
+            return
+
+        doc_id = event.get('documentKey', {}).get('_id')
+        full_document = event.get('fullDocument')
+        affected = set()
+        if operation == 'delete' or full_document is None:
+            affected.add(self._track(doc_id, None))
+        else:
+            user_id = _user_key(full_document)
+            affected.add(user_id)
+            affected.add(self._track(doc_id, user_id))
+
+        changed_at = None
+        cluster_time = event.get('clusterTime')
+        if cluster_time is not None:
+            changed_at = datetime.utcfromtimestamp(cluster_time.time)
+
+        self.changes += 1
+        self._patch(affected, changed_at)
+        self.last_sync_at = datetime.utcnow()
+
+    def _watch(self):
+        """Consume the change stream until stopped; raises if the server has no change streams"""
+        with self.collection.watch(full_document='updateLookup', resume_after=self._resume_token,
+                                   max_await_time_ms=int(self.interval * 1000)) as stream:
+            self.active_mode = 'watch'
+            print("Chat sync following the email_threads change stream")
+            while not self._stop.is_set():
+                event = stream.try_next()
+                if event is not None:
+                    self.apply_change(event)
+                self._resume_token = stream.resume_token
+                self.cache.touch()
+                self.last_sync_at = datetime.utcnow()
+
+    def _run(self):
+        if self.mode in ('auto', 'watch'):
+            try:
+                self._watch()
+                return
+            except Exception as e:
+                if self.mode == 'watch':
+                    self.errors += 1
+                    print(f"Error following change stream, chat sync stopped: {e}")
+                    return
+                print(f"Change streams unavailable ({e}); polling every {self.interval}s")
+
+        self.active_mode = 'poll'
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error polling for chat changes: {e}")
+
+    def start(self):
+        """Prime the document map and start syncing in a daemon thread"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.prime()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='chat-sync', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the sync thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def stats(self):
+        """
+        Get sync counters
+
+        Returns:
+            dict: Active mode, poll/change/patch counts and lag in seconds
+        """
+        return {
+            'mode': self.active_mode,
+            'documents': len(self._doc_users),
+            'polls': self.polls,
+            'changes': self.changes,
+            'patches': self.patches,
+            'users_patched': self.users_patched,
+            'errors': self.errors,
+            'last_lag_seconds': round(self.last_lag_seconds, 3) if self.last_lag_seconds is not None else None,
+            'max_lag_seconds': round(self.max_lag_seconds, 3),
+            'seconds_since_sync': round((datetime.utcnow() - self.last_sync_at).total_seconds(), 3) if self.last_sync_at else None
+        }
+
+
+if __name__ == "__main__":
+    from cache import ChatSnapshotCache
+    from db import extract_chat_histories
+
+    client, _ = connect_to_mongodb()
+    if client is not None:
+        collection = client[MONGO_CLIENT][MONGO_COLLECTION]
+
+        def load():
+            message_index = {}
+            return extract_chat_histories(collection, message_index), message_index
+
+        chat_cache = ChatSnapshotCache(load)
+        chat_cache.get()
+        chat_sync = ChatSync(collection, chat_cache, mode=CHAT_SYNC if CHAT_SYNC != 'off' else 'auto')
+        chat_sync.start()
+        try:
+            while True:
+                time.sleep(chat_sync.interval)
+                print(chat_sync.stats())
+        except KeyboardInterrupt:
+            chat_sync.stop()
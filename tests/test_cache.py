@@ -0,0 +1,77 @@
+"""
+ResultCache and ChatSnapshotCache tests
+"""
+
+import pytest
+
+from cache import ChatSnapshotCache, ResultCache
+
+
+def test_result_cache_hits_and_misses():
+    cache = ResultCache(4)
+
+    assert cache.get('stats', 'k') == (False, None)
+    cache.put('stats', 'k', {'total': 1}, ttl=60)
+    assert cache.get('stats', 'k') == (True, {'total': 1})
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(2)
+    cache.put('route', 'a', 1, ttl=60)
+    cache.put('route', 'b', 2, ttl=60)
+    cache.get('route', 'a')
+
+    cache.put('route', 'c', 3, ttl=60)
+
+    assert cache.get('route', 'b') == (False, None)
+    assert cache.get('route', 'a') == (True, 1)
+    assert cache.get('route', 'c') == (True, 3)
+
+
+def test_result_cache_expires_entries():
+    cache = ResultCache(2)
+
+    cache.put('route', 'a', 1, ttl=0)
+
+    assert cache.get('route', 'a') == (False, None)
+
+
+def test_result_cache_drops_values_computed_before_an_invalidation():
+    cache = ResultCache(2)
+    cache.put('route', 'a', 1, ttl=60)
+    generation = cache.generation
+
+    cache.invalidate()
+    cache.put('route', 'b', 2, ttl=60, generation=generation)
+
+    assert cache.get('route', 'a') == (False, None)
+    assert cache.get('route', 'b') == (False, None)
+
+
+def test_snapshot_cache_keeps_the_previous_snapshot_when_a_reload_fails():
+    loads = [({'u1': {}}, {}), RuntimeError('cursor died')]
+
+    def loader():
+        result = loads.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    cache = ChatSnapshotCache(loader, ttl=60)
+    first = cache.refresh()
+
+    assert cache.refresh() is first
+    assert cache.version == first.version
+    assert cache.stats()['failed_rebuilds'] == 1
+
+
+def test_snapshot_cache_raises_when_there_is_nothing_to_serve():
+    def loader():
+        raise RuntimeError('cursor died')
+
+    with pytest.raises(RuntimeError):
+        ChatSnapshotCache(loader, ttl=60).get()
@@ -0,0 +1,45 @@
+"""
+apply_update tests: the local after-image must match what MongoDB stores
+"""
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from feedback import apply_update
+
+
+OPS = [
+    {'$set': {'feedback': 'good'}, '$setOnInsert': {'user_id': 'u1'}},
+    {'$push': {'comments': 'nice'}, '$setOnInsert': {'comments_count': 0}},
+    {'$push': {'comments': {'$each': ['a', 'b']}}, '$inc': {'comments_count': 2}},
+    {'$set': {'feedback': None}, '$inc': {'edits': 1}},
+]
+
+
+@pytest.mark.parametrize('ops', OPS)
+def test_matches_an_upsert_insert(ops):
+    collection = mongomock.MongoClient().db.alfred_feedback
+
+    collection.update_one({'_id': 'm1'}, ops, upsert=True)
+
+    assert apply_update(None, 'm1', ops) == collection.find_one({'_id': 'm1'})
+
+
+@pytest.mark.parametrize('ops', OPS)
+def test_matches_an_update_of_an_existing_document(ops):
+    collection = mongomock.MongoClient().db.alfred_feedback
+    before = {'_id': 'm1', 'feedback': 'bad', 'comments': ['first'], 'comments_count': 1, 'user_id': 'u0'}
+    collection.insert_one(dict(before))
+
+    collection.update_one({'_id': 'm1'}, ops, upsert=True)
+
+    assert apply_update(before, 'm1', ops) == collection.find_one({'_id': 'm1'})
+
+
+def test_does_not_modify_the_before_image():
+    before = {'_id': 'm1', 'comments': ['first']}
+
+    apply_update(before, 'm1', {'$push': {'comments': 'second'}})
+
+    assert before == {'_id': 'm1', 'comments': ['first']}
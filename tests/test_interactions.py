@@ -0,0 +1,76 @@
+"""
+select_interactions tests on a small hand-built InteractionIndex
+"""
+
+from interactions import InteractionIndex, select_interactions
+
+
+def _row(timestamp, message_id, user_id, function_name=None):
+    return ((timestamp, message_id), user_id, function_name, {'message_id': message_id})
+
+
+ROWS = [
+    _row('2024-01-01T10:00:00', 'm1', 'u1'),
+    _row('2024-01-01T11:00:00', 'm2', 'u2', 'search'),
+    _row('2024-01-02T09:00:00', 'm3', 'u1', 'search'),
+    _row('2024-01-02T09:00:00', 'm4', 'u2'),
+    _row('2024-01-03T08:00:00', 'm5', 'u1'),
+]
+
+
+def _ids(rows):
+    return [row[0][1] for row in rows]
+
+
+def test_pages_follow_the_cursor_to_the_end():
+    index = InteractionIndex(list(reversed(ROWS)))
+    seen = []
+    after = None
+    while True:
+        rows, after = select_interactions(index, after=after, limit=2)
+        seen.extend(_ids(rows))
+        if after is None:
+            break
+
+    assert seen == ['m1', 'm2', 'm3', 'm4', 'm5']
+
+
+def test_last_full_page_has_no_cursor():
+    index = InteractionIndex(ROWS)
+
+    rows, after = select_interactions(index, limit=5)
+
+    assert len(rows) == 5
+    assert after is None
+
+
+def test_user_function_and_date_filters():
+    index = InteractionIndex(ROWS)
+
+    assert _ids(select_interactions(index, user='u1')[0]) == ['m1', 'm3', 'm5']
+    assert _ids(select_interactions(index, function_name='search')[0]) == ['m2', 'm3']
+    # A date prefix as the end bound includes the whole day
+    assert _ids(select_interactions(index, start='2024-01-02', end='2024-01-02')[0]) == ['m3', 'm4']
+    assert select_interactions(index, user='nobody') == ([], None)
+
+
+def test_subset_partition_is_memoized_per_version():
+    index = InteractionIndex(ROWS)
+    calls = []
+
+    def rated():
+        calls.append(1)
+        return {'m5', 'm2', 'missing'}
+
+    partition = index.subset('good', 1, rated)
+    assert index.subset('good', 1, rated) is partition
+    assert len(calls) == 1
+
+    rows, after = select_interactions(index, limit=1, partition=partition)
+    assert _ids(rows) == ['m2']
+    assert _ids(select_interactions(index, after=after, partition=partition)[0]) == ['m5']
+    # Other filters still apply within the partition
+    assert _ids(select_interactions(index, user='u1', partition=partition)[0]) == ['m5']
+
+    index.subset('good', 2, rated)
+    assert len(calls) == 2
@@ -0,0 +1,71 @@
+"""
+apply_feedback_changes tests against an in-memory mongomock database
+"""
+
+from datetime import datetime
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from rollups import ROLLUP_COLLECTION, TOTALS_ID, apply_feedback_changes
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def _built(db):
+    # Just enough of a built rollup collection: the totals document marks it as complete
+    db[ROLLUP_COLLECTION].insert_one({
+        '_id': TOTALS_ID, 'feedback_docs': 1, 'comments': 0, 'commented': 0, 'responses': 1,
+        'ratings': {'good': 1, 'bad': 0, 'neutral': 0, 'none': 0}
+    })
+    db[ROLLUP_COLLECTION].insert_one({
+        '_id': '2024-01-01', 'date': datetime(2024, 1, 1), 'feedback_docs': 1, 'comments': 0, 'commented': 0,
+        'responses': 1, 'ratings': {'good': 1, 'bad': 0, 'neutral': 0, 'none': 0}
+    })
+
+
+def test_does_nothing_before_the_rollups_are_built(db):
+    apply_feedback_changes(db, [(None, {'_id': 'm1', 'feedback': 'good', 'timestamp': datetime(2024, 1, 1)})])
+
+    assert db[ROLLUP_COLLECTION].count_documents({}) == 0
+
+
+def test_insert_and_update_deltas(db):
+    _built(db)
+    rerated = {'_id': 'm0', 'feedback': 'good', 'comments': [], 'timestamp': datetime(2024, 1, 1)}
+
+    apply_feedback_changes(db, [
+        (None, {'_id': 'm1', 'feedback': 'bad', 'comments': ['why'], 'timestamp': datetime(2024, 1, 2, 15)}),
+        (rerated, dict(rerated, feedback='neutral', comments=['ok'])),
+    ])
+
+    collection = db[ROLLUP_COLLECTION]
+    totals = collection.find_one({'_id': TOTALS_ID})
+    assert totals['feedback_docs'] == 2
+    assert totals['comments'] == 2
+    assert totals['commented'] == 2
+    assert totals['ratings'] == {'good': 0, 'bad': 1, 'neutral': 1, 'none': 0}
+
+    first = collection.find_one({'_id': '2024-01-01'})
+    assert first['ratings'] == {'good': 0, 'bad': 0, 'neutral': 1, 'none': 0}
+    assert first['comments'] == 1
+
+    # A day with no document yet is created with its date
+    second = collection.find_one({'_id': '2024-01-02'})
+    assert second['date'] == datetime(2024, 1, 2)
+    assert second['feedback_docs'] == 1
+    assert second['ratings'] == {'bad': 1}
+
+
+def test_unchanged_counters_write_nothing(db):
+    _built(db)
+    doc = {'_id': 'm0', 'feedback': 'good', 'comments': [], 'timestamp': datetime(2024, 1, 1)}
+    before = list(db[ROLLUP_COLLECTION].find())
+
+    apply_feedback_changes(db, [(doc, dict(doc, note='edited'))])
+
+    assert list(db[ROLLUP_COLLECTION].find()) == before
@@ -0,0 +1,113 @@
+"""
+ChatSync tests against an in-memory mongomock collection
+
+mongomock has no change streams, so polling is exercised through
+poll_once() and the change stream path by feeding events to apply_change().
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from cache import ChatSnapshotCache
+from db import extract_chat_histories
+from sync import ChatSync
+
+
+def _thread(user_id, session_id, message_id, content, **fields):
+    doc = {
+        'userid': user_id,
+        'sessions': [{
+            'session_id': session_id,
+            'chat_history': [{
+                'message_id': message_id,
+                'timestamp': datetime(2024, 1, 1),
+                'messages': [{'role': 'user', 'content': content}, {'role': 'assistant', 'content': 'ok'}]
+            }]
+        }]
+    }
+    doc.update(fields)
+    return doc
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.email_threads
+    collection.insert_many([_thread('u1', 's1', 'm1', 'hello'), _thread('u2', 's2', 'm2', 'hi')])
+    return collection
+
+
+@pytest.fixture
+def sync(collection):
+    def load():
+        message_index = {}
+        return extract_chat_histories(collection, message_index), message_index
+
+    cache = ChatSnapshotCache(load, ttl=3600)
+    cache.get()
+    sync = ChatSync(collection, cache, mode='poll')
+    sync.prime()
+    return sync
+
+
+def _content(sync, user_id, session_id):
+    return sync.cache.peek().data[user_id][session_id]['chat_history'][0]['messages'][0]['content']
+
+
+def test_poll_detects_insert(collection, sync):
+    collection.insert_one(_thread('u3', 's3', 'm3', 'new'))
+
+    assert sync.poll_once() == 1
+    assert _content(sync, 'u3', 's3') == 'new'
+    assert 'm3' in sync.cache.peek().message_index
+    assert sync.poll_once() == 0
+
+
+def test_poll_detects_update_once_writers_set_the_marker(collection, sync):
+    # No document had updated_at when the sync was primed
+    collection.update_one({'userid': 'u1'}, {'$set': {
+        'sessions.0.chat_history.0.messages.0.content': 'edited',
+        'updated_at': datetime.utcnow()
+    }})
+
+    assert sync.poll_once() == 1
+    assert _content(sync, 'u1', 's1') == 'edited'
+    assert sync.poll_once() == 0
+
+    collection.update_one({'userid': 'u2'}, {'$set': {
+        'sessions.0.chat_history.0.messages.0.content': 'edited too',
+        'updated_at': datetime.utcnow() + timedelta(seconds=1)
+    }})
+
+    assert sync.poll_once() == 1
+    assert _content(sync, 'u2', 's2') == 'edited too'
+    assert _content(sync, 'u1', 's1') == 'edited'
+
+
+def test_poll_detects_delete(collection, sync):
+    collection.delete_one({'userid': 'u2'})
+
+    assert sync.poll_once() == 1
+    snapshot = sync.cache.peek()
+    assert 'u2' not in snapshot.data
+    assert 'm2' not in snapshot.message_index
+    assert 'u1' in snapshot.data
+
+
+def test_apply_change_insert_update_delete(collection, sync):
+    doc = _thread('u3', 's3', 'm3', 'streamed')
+    collection.insert_one(doc)
+    sync.apply_change({'operationType': 'insert', 'documentKey': {'_id': doc['_id']}, 'fullDocument': doc})
+    assert _content(sync, 'u3', 's3') == 'streamed'
+
+    collection.update_one({'_id': doc['_id']}, {'$set': {'sessions.0.chat_history.0.messages.0.content': 'changed'}})
+    sync.apply_change({'operationType': 'update', 'documentKey': {'_id': doc['_id']},
+                       'fullDocument': collection.find_one({'_id': doc['_id']})})
+    assert _content(sync, 'u3', 's3') == 'changed'
+
+    collection.delete_one({'_id': doc['_id']})
+    sync.apply_change({'operationType': 'delete', 'documentKey': {'_id': doc['_id']}})
+    assert 'u3' not in sync.cache.peek().data
+    assert 'm3' not in sync.cache.peek().message_index
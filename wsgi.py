@@ -0,0 +1,16 @@
+"""
+WSGI Entry Point
+
+Production servers import `app` from here, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing it does no database I/O; gunicorn.conf.py warms each worker's
+caches after it forks. Other WSGI servers can call warm_caches() once per
+process before serving.
+"""
+
+from app import app, warm_caches
+
+# Conventional name looked up by some WSGI servers
+application = app